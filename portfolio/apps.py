@@ -0,0 +1,5 @@
+from django.contrib.admin.apps import AdminConfig
+
+
+class PortfolioAdminConfig(AdminConfig):
+    default_site = 'users.sites.CachedAdminSite'
@@ -2,6 +2,12 @@
 ASGI config for portfolio project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server such as ``uvicorn portfolio.asgi:application``
+to enable the live user map stream (``users.views.UserMapEventsView``).
+The Docker image and docker-compose.yml do this.
+
+With DEBUG on, static files are served from the app static directories,
+as ``runserver`` does, so the admin and Leaflet assets load under uvicorn.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -9,8 +15,13 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'portfolio.settings')
 
 application = get_asgi_application()
+
+if settings.DEBUG:
+    application = ASGIStaticFilesHandler(application)
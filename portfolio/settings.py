@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 import os
 from pathlib import Path
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 
 
@@ -36,7 +37,7 @@ ALLOWED_HOSTS = ["*"]
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'portfolio.apps.PortfolioAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -51,6 +52,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'users.middleware.ProfilingMiddleware',
+    'users.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -72,6 +75,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'users.context_processors.map_tiles',
             ],
         },
     },
@@ -101,6 +105,43 @@ DATABASES = {
     }
 }
 
+# Read replicas
+# DATABASE_REPLICA_HOSTS is a comma-separated list of replicas of the default
+# database, each as host[:port][/name], e.g. "replica1,localhost:5433/portfolio".
+# Port and name default to those of the default database. Map, dashboard and
+# admin list pages read from them, except for REPLICA_PIN_SECONDS after a
+# client writes, or when a replica lags more than REPLICA_MAX_LAG seconds. To
+# try it locally, point an entry at a second database on localhost.
+
+READ_REPLICAS = []
+for index, entry in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',')), 1):
+    alias = f'replica{index}'
+    replica = urlsplit('//' + entry.strip())
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': replica.hostname,
+        'PORT': str(replica.port) if replica.port else DATABASES['default']['PORT'],
+        'NAME': replica.path.lstrip('/') or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    READ_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['users.routers.ReplicaRouter']
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 10))
+REPLICA_LAG_CHECK_INTERVAL = 5
+REPLICA_PIN_SECONDS = 15
+
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+]
+
+# Seconds to keep each user's resolved permissions and admin app list cached.
+# Entries are dropped early when the user's groups or permissions change.
+# Caching is only on with a shared cache (CACHE_URL): with per-process caches
+# a change made in one worker would not invalidate the others.
+ADMIN_CACHE_TIMEOUT = 300
+ADMIN_CACHE_ENABLED = bool(os.environ.get('CACHE_URL'))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -136,6 +177,7 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -150,3 +192,96 @@ EMAIL_USE_TLS = True
 EMAIL_PORT = 587
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
+
+# Auth event retention
+# Login/logout rows in django_admin_log are rolled up into hourly aggregates
+# and pruned after this many days by `manage.py compact_auth_events`.
+AUTH_EVENT_RETENTION_DAYS = int(os.environ.get('AUTH_EVENT_RETENTION_DAYS', 90))
+AUTH_EVENT_BATCH_SIZE = int(os.environ.get('AUTH_EVENT_BATCH_SIZE', 5000))
+AUTH_EVENT_ARCHIVE_DIR = os.environ.get('AUTH_EVENT_ARCHIVE_DIR')
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Set CACHE_URL to a Redis URL so throttling and cached state are shared
+# between workers; otherwise each process keeps its own in-memory cache.
+
+if os.environ.get('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('CACHE_URL'),
+        }
+    }
+
+# Login throttling
+# Attempts are limited per username and per client IP with token buckets,
+# before the password is hashed. Repeated failures for a username add an
+# exponentially growing delay, capped at LOGIN_THROTTLE_MAX_DELAY seconds.
+LOGIN_THROTTLE_CACHE = 'default'
+LOGIN_THROTTLE_USERNAME_BURST = int(os.environ.get('LOGIN_THROTTLE_USERNAME_BURST', 5))
+LOGIN_THROTTLE_USERNAME_PER_MINUTE = int(os.environ.get('LOGIN_THROTTLE_USERNAME_PER_MINUTE', 5))
+LOGIN_THROTTLE_IP_BURST = int(os.environ.get('LOGIN_THROTTLE_IP_BURST', 20))
+LOGIN_THROTTLE_IP_PER_MINUTE = int(os.environ.get('LOGIN_THROTTLE_IP_PER_MINUTE', 30))
+LOGIN_THROTTLE_FREE_FAILURES = 3
+LOGIN_THROTTLE_MAX_DELAY = 300
+LOGIN_THROTTLE_TRUST_X_FORWARDED_FOR = os.environ.get('LOGIN_THROTTLE_TRUST_X_FORWARDED_FOR') == 'True'
+
+# Location ingest
+# Batches posted to /users/api/locations/ are buffered per process, keeping the
+# latest update per user, and written every LOCATION_INGEST_FLUSH_INTERVAL
+# seconds (0 writes each batch immediately).
+LOCATION_INGEST_MAX_BATCH = 5000
+LOCATION_INGEST_FLUSH_INTERVAL = float(os.environ.get('LOCATION_INGEST_FLUSH_INTERVAL', 1.0))
+LOCATION_INGEST_MAX_BUFFERED = 20000
+LOCATION_INGEST_CHUNK_SIZE = 1000
+
+# Map tiles
+# With MAP_TILES_MBTILES set, maps load base tiles from the built-in
+# /users/tiles/ endpoint backed by that MBTiles file. Seed it with
+# `manage.py seed_tiles`. MAP_TILES_URL overrides the browser tile URL.
+MAP_TILES_MBTILES = os.environ.get('MAP_TILES_MBTILES')
+MAP_TILES_URL = os.environ.get('MAP_TILES_URL')
+MAP_TILES_ATTRIBUTION = '© OpenStreetMap contributors'
+# Tiles are only downloaded from an explicitly configured upstream, identified
+# with a contact address: the OpenStreetMap tile usage policy forbids bulk
+# downloads from tile.openstreetmap.org, so use a provider that allows them.
+MAP_TILES_UPSTREAM_URL = os.environ.get('MAP_TILES_UPSTREAM_URL')
+MAP_TILES_PROXY_MISSES = os.environ.get('MAP_TILES_PROXY_MISSES') == 'True'
+MAP_TILES_CONTACT = os.environ.get('MAP_TILES_CONTACT')
+MAP_TILES_USER_AGENT = f'kartoza-portfolio-tile-cache/1.0 (contact: {MAP_TILES_CONTACT})'
+MAP_TILES_CACHE_SIZE = 4096
+MAP_TILES_MAX_AGE = 7 * 24 * 60 * 60
+
+# Bulk user jobs
+# Admin actions on more than BULK_JOB_SYNC_LIMIT users (BULK_INVITE_SYNC_LIMIT
+# for invitations) run as background jobs committed in chunks of
+# BULK_JOB_CHUNK_SIZE. With BULK_JOB_RUN_IN_PROCESS off, run
+# `manage.py run_bulk_jobs --loop` as a separate worker instead. Running jobs
+# without progress for BULK_JOB_STALE_AFTER seconds are resumed by
+# run_bulk_jobs or the "Requeue" admin action. Invitation jobs send
+# BULK_INVITE_CHUNK_SIZE emails at a time outside any transaction and commit
+# their progress after each chunk, so a resumed job re-sends at most one chunk.
+BULK_JOB_SYNC_LIMIT = 1000
+BULK_INVITE_SYNC_LIMIT = 20
+BULK_JOB_CHUNK_SIZE = 1000
+BULK_INVITE_CHUNK_SIZE = 20
+BULK_JOB_RUN_IN_PROCESS = os.environ.get('BULK_JOB_RUN_IN_PROCESS', 'True') == 'True'
+BULK_JOB_STALE_AFTER = 10 * 60
+
+# User purge
+# Deleting users runs as a bulk job: each transaction removes
+# PURGE_CHUNK_SIZE users with their dependent rows, deleting at most
+# PURGE_BATCH_SIZE rows per statement.
+PURGE_CHUNK_SIZE = 100
+PURGE_BATCH_SIZE = 1000
+
+# Request profiling
+# With PROFILING_ENABLED, staff can profile single requests with a token from
+# the "Request profiles" admin page, and PROFILING_SAMPLE_RATE (0 to 1) of all
+# requests are profiled. Only the newest PROFILING_MAX_PROFILES are kept.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == 'True'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_MAX_QUERIES = 500
+PROFILING_MAX_PROFILES = 500
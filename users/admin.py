@@ -1,19 +1,25 @@
 from django.conf import settings
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
 from django.contrib.auth.admin import UserAdmin
-from django.contrib.auth.tokens import default_token_generator
 from django.contrib.gis import admin
-from django.core.exceptions import ImproperlyConfigured
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
 from django.urls import path, reverse
-from django.utils.encoding import force_bytes
-from django.utils.http import urlsafe_base64_encode
+from django.utils.decorators import method_decorator
+from django.utils.html import format_html
 from django.utils.translation import gettext as _
 
-from .forms import CustomUserCreationForm
-from .models import CustomUser, UserProfile
-from .views import UserMapView
+from .emails import invitation_email, try_send_invitations
+from .forms import CustomUserCreationForm, TileOSMWidget
+from .jobs import enqueue_job, requeue_jobs
+from .models import BulkJob, CustomUser, RequestProfile, UserProfile
+from .profiling import TOKEN_HEADER, TOKEN_PARAM, make_token, stats_summary
+from .purge import purge_counts
+from .routers import use_read_replica
+from .views import AuthEventDashboardView, UserMapView
 
 
 class CustomUserAdmin(UserAdmin):
@@ -41,8 +47,101 @@ class CustomUserAdmin(UserAdmin):
             },
         ),
     )
+    actions = ["deactivate_users", "reactivate_users", "reinvite_users", "purge_users"]
+
+    def _queue_bulk_job(self, request, kind, queryset, **params):
+        """Hands a large action to a background job and links to its progress."""
+        job = enqueue_job(
+            kind,
+            queryset.order_by("pk").values_list("pk", flat=True),
+            created_by=request.user,
+            **params,
+        )
+        self.message_user(
+            request,
+            format_html(
+                'Started a background job for {} users. <a href="{}">View progress</a>.',
+                job.total,
+                reverse("admin:users_bulkjob_change", args=[job.pk]),
+            ),
+            messages.INFO,
+        )
+
+    def _set_active(self, request, queryset, is_active, kind):
+        # Never lock the acting admin out of their own account.
+        queryset = queryset.exclude(pk=request.user.pk)
+        count = queryset.count()
+        if count > settings.BULK_JOB_SYNC_LIMIT:
+            self._queue_bulk_job(request, kind, queryset)
+            return
+        updated = queryset.update(is_active=is_active)
+        state = "reactivated" if is_active else "deactivated"
+        self.message_user(request, f"{updated} users {state}.", messages.SUCCESS)
+
+    @admin.action(description="Deactivate selected users", permissions=["change"])
+    def deactivate_users(self, request, queryset):
+        """Deactivate users with a single UPDATE, or in the background if there are many."""
+        self._set_active(request, queryset, False, BulkJob.DEACTIVATE)
+
+    @admin.action(description="Reactivate selected users", permissions=["change"])
+    def reactivate_users(self, request, queryset):
+        """Reactivate users with a single UPDATE, or in the background if there are many."""
+        self._set_active(request, queryset, True, BulkJob.REACTIVATE)
+
+    @admin.action(description="Re-send invitation emails", permissions=["change"])
+    def reinvite_users(self, request, queryset):
+        """Re-send invitations over one mail connection, or in the background if there are many."""
+        base_url = request.build_absolute_uri("/")
+        if queryset.count() > settings.BULK_INVITE_SYNC_LIMIT:
+            self._queue_bulk_job(request, BulkJob.REINVITE, queryset, base_url=base_url)
+            return
+        sent, failed = try_send_invitations(queryset, base_url)
+        if failed:
+            self.message_user(
+                request,
+                f"Sent {sent} invitations, {failed} failed. See the logs for details.",
+                messages.ERROR,
+            )
+        else:
+            self.message_user(request, f"Sent {sent} invitations.", messages.SUCCESS)
+
+    @admin.action(description="Delete selected users and their data", permissions=["delete"])
+    def purge_users(self, request, queryset):
+        """
+        Confirm with row counts, then delete the users in a background job.
+
+        Replaces the built-in bulk delete, which loads every related object to
+        build its confirmation page and deletes everything in one transaction.
+        """
+        queryset = queryset.exclude(pk=request.user.pk)
+        if request.POST.get("post") == "yes":
+            self._queue_bulk_job(request, BulkJob.PURGE, queryset)
+            return None
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Are you sure?",
+            "opts": self.model._meta,
+            "counts": purge_counts(queryset),
+            "selected": request.POST.getlist(ACTION_CHECKBOX_NAME),
+            # Posted back so "Select all" still covers every page when confirmed.
+            "select_across": request.POST.get("select_across", "0"),
+            "action_checkbox_name": ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, "admin/users/purge_confirmation.html", context)
+
+    def get_actions(self, request):
+        """Drop the built-in bulk delete in favour of ``purge_users``."""
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    @method_decorator(use_read_replica)
+    def changelist_view(self, request, extra_context=None):
+        """Serve the user list from a read replica."""
+        return super().changelist_view(request, extra_context)
+
     def get_urls(self):
-        """Add custom admin URL for the user map view."""
+        """Add custom admin URLs for the user map and login activity views."""
         urls = super().get_urls()
         custom_urls = [
             path(
@@ -50,6 +149,11 @@ class CustomUserAdmin(UserAdmin):
                 self.admin_site.admin_view(UserMapView.as_view()),  # Protect with admin login
                 name="admin_user_map",
             ),
+            path(
+                "auth-dashboard/",
+                self.admin_site.admin_view(AuthEventDashboardView.as_view()),
+                name="admin_auth_dashboard",
+            ),
         ]
         return custom_urls + urls
 
@@ -64,42 +168,179 @@ class CustomUserAdmin(UserAdmin):
             # Create user profile
             UserProfile.objects.get_or_create(user=obj)
             try:
-                # Generate a valid password reset token
-                uid = urlsafe_base64_encode(force_bytes(obj.pk))
-                token = default_token_generator.make_token(obj)
-
-                # Correct password reset link
-                reset_link = request.build_absolute_uri(
-                    reverse(
-                        "password_reset_confirm", kwargs={"uidb64": uid, "token": token}
-                    )
-                )
-
-                # Render HTML email template
-                context = {
-                    "full_name": obj.get_full_name(),
-                    "reset_link": reset_link,
-                    "username": obj.username,
-                }
-                html_content = render_to_string("emails/invitation_email.html", context)
-
-                # Send email
-                email = EmailMultiAlternatives(
-                    subject="You're invited to our platform",
-                    body=f"Hello {obj.get_full_name()},\n\nYou've been registered by an admin.\n"
-                    f"Please set your password using this link: {reset_link}\n\nThank you!",
-                    from_email=settings.EMAIL_HOST_USER,
-                    to=[obj.email],
-                )
-                email.attach_alternative(html_content, "text/html")  # Attach HTML content
-                email.send()
+                invitation_email(obj, request.build_absolute_uri("/")).send()
             except (ImproperlyConfigured, ValueError, Exception) as e:
                 print(f"Failed to send email to {obj.email}: {e}")
 
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.GISModelAdmin):
+    gis_widget = TileOSMWidget
     list_display = ["id", "user", "location", "home_address"]
+    list_select_related = ["user"]
+
+    @method_decorator(use_read_replica)
+    def changelist_view(self, request, extra_context=None):
+        """Serve the profile list from a read replica."""
+        return super().changelist_view(request, extra_context)
+
+
+@admin.register(BulkJob)
+class BulkJobAdmin(admin.ModelAdmin):
+    list_display = ["id", "kind", "status", "progress", "created_by", "created_at"]
+    list_filter = ["kind", "status"]
+    readonly_fields = [
+        "kind",
+        "status",
+        "progress",
+        "failed",
+        "error",
+        "created_by",
+        "created_at",
+        "started_at",
+        "heartbeat_at",
+        "finished_at",
+    ]
+    fields = readonly_fields
+    actions = ["requeue"]
+
+    @admin.action(description="Requeue failed or stalled jobs", permissions=["requeue"])
+    def requeue(self, request, queryset):
+        """Resume failed jobs and jobs whose worker stopped, from their last chunk."""
+        requeued = requeue_jobs(queryset)
+        self.message_user(request, f"Requeued {requeued} jobs.", messages.SUCCESS)
+
+    def has_requeue_permission(self, request):
+        """Requeueing needs the change permission the read-only admin otherwise hides."""
+        opts = self.opts
+        return request.user.has_perm(f"{opts.app_label}.change_{opts.model_name}")
+
+    @admin.display(description="progress")
+    def progress(self, obj):
+        """Returns processed/total users with a percentage."""
+        return f"{obj.processed}/{obj.total} ({obj.percent}%)"
+
+    def has_add_permission(self, request):
+        """Jobs are only created by admin actions."""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """Jobs are read-only progress records."""
+        return False
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "method",
+        "path",
+        "status_code",
+        "duration_ms",
+        "query_count",
+        "query_time_ms",
+        "trigger",
+        "created_at",
+    ]
+    list_filter = ["trigger", "view_name"]
+    search_fields = ["path"]
+    readonly_fields = [
+        "method",
+        "path",
+        "view_name",
+        "status_code",
+        "trigger",
+        "user",
+        "duration_ms",
+        "query_count",
+        "query_time_ms",
+        "downloads",
+        "top_functions",
+        "sql",
+        "created_at",
+    ]
+    fields = readonly_fields
+
+    @admin.display(description="downloads")
+    def downloads(self, obj):
+        """Links to the cProfile stats and the folded flame graph stacks."""
+        return format_html(
+            '<a href="{}">cProfile stats (.prof)</a> | <a href="{}">Flame graph stacks (folded)</a>',
+            reverse("admin:users_requestprofile_stats", args=[obj.pk]),
+            reverse("admin:users_requestprofile_stacks", args=[obj.pk]),
+        )
+
+    @admin.display(description="top functions")
+    def top_functions(self, obj):
+        """Returns the slowest functions by cumulative time."""
+        return format_html("<pre>{}</pre>", stats_summary(obj))
+
+    @admin.display(description="SQL")
+    def sql(self, obj):
+        """Returns the recorded queries, slowest first."""
+        queries = sorted(obj.queries, key=lambda query: query["ms"], reverse=True)
+        lines = "\n\n".join(
+            f"[{query['alias']}] {query['ms']} ms\n{query['sql']}" for query in queries
+        )
+        return format_html("<pre>{}</pre>", lines)
+
+    def _get_downloadable(self, request, pk):
+        """Returns the profile if the user may view it, like the change view does."""
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        return profile
+
+    def download_stats(self, request, pk):
+        """Serves the stats file for pstats, snakeviz or similar viewers."""
+        profile = self._get_downloadable(request, pk)
+        response = HttpResponse(bytes(profile.stats), content_type="application/octet-stream")
+        response["Content-Disposition"] = f'attachment; filename="profile-{pk}.prof"'
+        return response
+
+    def download_stacks(self, request, pk):
+        """Serves folded stacks for flamegraph.pl, speedscope or similar viewers."""
+        profile = self._get_downloadable(request, pk)
+        response = HttpResponse(profile.folded_stacks, content_type="text/plain")
+        response["Content-Disposition"] = f'attachment; filename="profile-{pk}.folded"'
+        return response
+
+    def get_urls(self):
+        """Add download URLs for stored profiles."""
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                "<int:pk>/stats.prof",
+                self.admin_site.admin_view(self.download_stats),
+                name="users_requestprofile_stats",
+            ),
+            path(
+                "<int:pk>/stacks.folded",
+                self.admin_site.admin_view(self.download_stacks),
+                name="users_requestprofile_stacks",
+            ),
+        ]
+        return custom_urls + urls
+
+    def changelist_view(self, request, extra_context=None):
+        """Show a profiling token for the current staff member."""
+        extra_context = {
+            **(extra_context or {}),
+            "profiling_enabled": settings.PROFILING_ENABLED,
+            "profile_token": make_token(request.user),
+            "token_header": TOKEN_HEADER,
+            "token_param": TOKEN_PARAM,
+            "token_max_age_minutes": settings.PROFILING_TOKEN_MAX_AGE // 60,
+        }
+        return super().changelist_view(request, extra_context)
+
+    def has_add_permission(self, request):
+        """Profiles are only created by the profiling middleware."""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """Profiles are read-only records."""
+        return False
 
 
 admin.site.register(CustomUser, CustomUserAdmin)
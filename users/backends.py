@@ -0,0 +1,86 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+KEY_PREFIX = "admin-cache"
+GLOBAL_GENERATION_KEY = f"{KEY_PREFIX}:generation"
+
+
+def _user_generation_key(user_id):
+    return f"{KEY_PREFIX}:generation:{user_id}"
+
+
+def permission_cache_key(user_id, name):
+    """
+    Builds the cache key for permission-derived data of one user.
+
+    The key embeds a global generation and a per-user generation, so bumping
+    either one makes every older entry unreachable without having to find
+    and delete it.
+
+    Args:
+        user_id (int): Primary key of the user.
+        name (str): What is being cached, e.g. ``"user-perms"`` or ``"app-list"``.
+
+    Returns:
+        str: The versioned cache key.
+    """
+    keys = [GLOBAL_GENERATION_KEY, _user_generation_key(user_id)]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, uuid4().hex, timeout=None)
+            generations[key] = cache.get(key)
+    return f"{KEY_PREFIX}:{name}:{user_id}:" + ":".join(generations[k] for k in keys)
+
+
+def invalidate_user_permissions(user_id):
+    """Drops cached permissions and admin app lists for a single user."""
+    cache.delete(_user_generation_key(user_id))
+
+
+def invalidate_all_permissions():
+    """Drops cached permissions and admin app lists for every user."""
+    cache.delete(GLOBAL_GENERATION_KEY)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that keeps each user's resolved permission sets in the cache.
+
+    Django only caches permissions on the user instance, which is rebuilt on
+    every request. Object-level checks, inactive or anonymous users, and
+    everything while ``ADMIN_CACHE_ENABLED`` is off are passed straight
+    through to ModelBackend.
+    """
+
+    def get_user_permissions(self, user_obj, obj=None):
+        return self._get_cached_permissions(
+            user_obj, obj, "user-perms", super().get_user_permissions
+        )
+
+    def get_group_permissions(self, user_obj, obj=None):
+        return self._get_cached_permissions(
+            user_obj, obj, "group-perms", super().get_group_permissions
+        )
+
+    def _get_cached_permissions(self, user_obj, obj, name, fetch):
+        if (
+            not settings.ADMIN_CACHE_ENABLED
+            or obj is not None
+            or not user_obj.is_active
+            or user_obj.is_anonymous
+        ):
+            return fetch(user_obj, obj)
+
+        attr = f"_cached_{name.replace('-', '_')}"
+        if not hasattr(user_obj, attr):
+            key = permission_cache_key(user_obj.pk, name)
+            perms = cache.get(key)
+            if perms is None:
+                perms = fetch(user_obj)
+                cache.set(key, perms, settings.ADMIN_CACHE_TIMEOUT)
+            setattr(user_obj, attr, perms)
+        return getattr(user_obj, attr)
@@ -0,0 +1,11 @@
+from django.conf import settings
+
+from .tiles import tile_url_template
+
+
+def map_tiles(request):
+    """Adds the base map tile URL and attribution for Leaflet maps."""
+    return {
+        "map_tile_url": tile_url_template(),
+        "map_tile_attribution": settings.MAP_TILES_ATTRIBUTION,
+    }
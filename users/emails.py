@@ -0,0 +1,89 @@
+import logging
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+logger = logging.getLogger(__name__)
+
+
+def invitation_email(user, base_url, connection=None):
+    """
+    Builds the invitation email with a link for the user to set their password.
+
+    Args:
+        user (CustomUser): The invited user.
+        base_url (str): Absolute URL of the site, e.g. ``https://example.com/``.
+        connection: Optional mail connection to send through.
+
+    Returns:
+        EmailMultiAlternatives: The email, ready to send.
+    """
+    # Generate a valid password reset token
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    reset_link = urljoin(
+        base_url,
+        reverse("password_reset_confirm", kwargs={"uidb64": uid, "token": token}),
+    )
+
+    # Render HTML email template
+    context = {
+        "full_name": user.get_full_name(),
+        "reset_link": reset_link,
+        "username": user.username,
+    }
+    html_content = render_to_string("emails/invitation_email.html", context)
+
+    email = EmailMultiAlternatives(
+        subject="You're invited to our platform",
+        body=f"Hello {user.get_full_name()},\n\nYou've been registered by an admin.\n"
+        f"Please set your password using this link: {reset_link}\n\nThank you!",
+        from_email=settings.EMAIL_HOST_USER,
+        to=[user.email],
+        connection=connection,
+    )
+    email.attach_alternative(html_content, "text/html")  # Attach HTML content
+    return email
+
+
+def send_invitations(users, base_url):
+    """
+    Sends invitation emails to many users over a single mail connection.
+
+    Returns:
+        int: The number of emails sent.
+    """
+    with get_connection() as connection:
+        return connection.send_messages(
+            [invitation_email(user, base_url) for user in users if user.email]
+        ) or 0
+
+
+def try_send_invitations(users, base_url):
+    """
+    Sends invitation emails one by one over a single mail connection, logging
+    failures instead of raising them.
+
+    Returns:
+        tuple[int, int]: The number of emails sent and the number that failed.
+    """
+    users = [user for user in users if user.email]
+    sent = 0
+    try:
+        with get_connection() as connection:
+            for user in users:
+                try:
+                    invitation_email(user, base_url, connection).send()
+                    sent += 1
+                except Exception:
+                    logger.exception("Failed to send invitation to %s", user.email)
+    except Exception:
+        # The connection itself could not be opened or closed.
+        logger.exception("Failed to send invitations")
+    return sent, len(users) - sent
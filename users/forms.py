@@ -1,7 +1,21 @@
 from django import forms
+from django.conf import settings
 from .models import CustomUser, UserProfile
 from django.contrib.gis import forms as gis_forms
 
+from .tiles import tile_url_template
+
+
+class TileOSMWidget(gis_forms.OSMWidget):
+    """OSMWidget that loads its base map from the configured tile source."""
+    template_name = "gis/openlayers-tiles.html"
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["tile_url"] = tile_url_template()
+        context["tile_attribution"] = settings.MAP_TILES_ATTRIBUTION
+        return context
+
 
 class CustomUserCreationForm(forms.ModelForm):
     """Custom form for creating users in the admin panel with required email"""
@@ -19,7 +33,7 @@ class CustomUserCreationForm(forms.ModelForm):
 
 class UserProfileForm(forms.ModelForm):
     location = gis_forms.PointField(
-        widget=gis_forms.OSMWidget(attrs={
+        widget=TileOSMWidget(attrs={
             'map_width': 600,
             'map_height': 400,
             'default_lat': 18.153042,
@@ -0,0 +1,234 @@
+import atexit
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import UserProfile
+from .signals import locations_updated
+
+logger = logging.getLogger(__name__)
+
+LocationUpdate = namedtuple("LocationUpdate", ["user_id", "lon", "lat", "timestamp"])
+
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def parse_location_update(data):
+    """
+    Validates one ``{"user", "lon", "lat", "timestamp"}`` item of an ingest batch.
+
+    The timestamp may be an ISO 8601 string or epoch seconds; naive times are
+    taken as UTC and a missing timestamp means now.
+
+    Returns:
+        LocationUpdate: The parsed update.
+
+    Raises:
+        ValueError: If the item is malformed or out of range.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Update must be an object.")
+    try:
+        user_id = int(data["user"])
+        lon = float(data["lon"])
+        lat = float(data["lat"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Update needs numeric 'user', 'lon' and 'lat'.") from None
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise ValueError("Coordinates are out of range.")
+
+    raw_timestamp = data.get("timestamp")
+    now = timezone.now()
+    if raw_timestamp is None:
+        timestamp = now
+    elif isinstance(raw_timestamp, (int, float)):
+        try:
+            timestamp = datetime.fromtimestamp(raw_timestamp, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError("Timestamp is out of range.") from None
+    else:
+        timestamp = parse_datetime(str(raw_timestamp))
+        if timestamp is None:
+            raise ValueError("Timestamp is not a valid ISO 8601 date.")
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp, dt_timezone.utc)
+    if timestamp > now + MAX_CLOCK_SKEW:
+        raise ValueError("Timestamp is in the future.")
+
+    return LocationUpdate(user_id, lon, lat, timestamp)
+
+
+def write_locations(updates):
+    """
+    Writes location updates to ``UserProfile`` with set-based UPDATEs.
+
+    On PostgreSQL each chunk is a single ``UPDATE ... FROM (VALUES ...)``.
+    A profile is only changed when the update is newer than the stored
+    ``location_updated_at``, so late or replayed batches cannot move a user
+    backwards. Rows are written in user id order to keep concurrent flushes
+    from deadlocking.
+
+    Args:
+        updates (list[LocationUpdate]): At most one update per user.
+
+    Returns:
+        int: The number of profiles changed.
+    """
+    updates = sorted(updates, key=lambda update: update.user_id)
+    chunk_size = settings.LOCATION_INGEST_CHUNK_SIZE
+    changed = 0
+
+    for start in range(0, len(updates), chunk_size):
+        chunk = updates[start:start + chunk_size]
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                applied = _update_from_values(chunk)
+            else:
+                applied = _update_each(chunk)
+        changed += len(applied)
+        if applied:
+            locations_updated.send(sender=UserProfile, updates=applied)
+
+    return changed
+
+
+def _update_from_values(chunk):
+    values = ", ".join(["(%s, %s, %s, %s)"] * len(chunk))
+    params = [value for update in chunk for value in update]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {UserProfile._meta.db_table} AS p
+            SET location = ST_SetSRID(ST_MakePoint(v.lon::float8, v.lat::float8), 4326),
+                location_updated_at = v.ts::timestamptz
+            FROM (VALUES {values}) AS v(user_id, lon, lat, ts)
+            WHERE p.user_id = v.user_id::bigint
+              AND (p.location_updated_at IS NULL OR p.location_updated_at < v.ts::timestamptz)
+            RETURNING p.user_id, v.lon::float8, v.lat::float8
+            """,
+            params,
+        )
+        return cursor.fetchall()
+
+
+def _update_each(chunk):
+    applied = []
+    for update in chunk:
+        updated = (
+            UserProfile.objects.filter(user_id=update.user_id)
+            .filter(
+                Q(location_updated_at__isnull=True)
+                | Q(location_updated_at__lt=update.timestamp)
+            )
+            .update(
+                location=Point(update.lon, update.lat, srid=4326),
+                location_updated_at=update.timestamp,
+            )
+        )
+        if updated:
+            applied.append((update.user_id, update.lon, update.lat))
+    return applied
+
+
+class LocationBuffer:
+    """
+    In-process buffer that keeps only the latest pending update per user.
+
+    Updates are written when the flush window elapses (from a timer thread)
+    or straight away once ``LOCATION_INGEST_MAX_BUFFERED`` users are pending.
+    With a flush interval of 0 every batch is written synchronously. A batch
+    that fails to write is merged back and retried on the next flush, and
+    whatever is pending when the process exits is flushed then.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+
+    def _merge(self, updates, replace_equal=True):
+        """Keeps the newest update per user. Call with the lock held."""
+        for update in updates:
+            current = self._pending.get(update.user_id)
+            if (
+                current is None
+                or update.timestamp > current.timestamp
+                or (replace_equal and update.timestamp == current.timestamp)
+            ):
+                self._pending[update.user_id] = update
+
+    def _schedule(self):
+        """Starts the flush timer if one is due. Call with the lock held."""
+        interval = settings.LOCATION_INGEST_FLUSH_INTERVAL
+        if self._pending and interval > 0 and self._timer is None:
+            self._timer = threading.Timer(interval, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def add(self, updates):
+        """Merges updates into the buffer and flushes if it is due."""
+        with self._lock:
+            self._merge(updates)
+            full = len(self._pending) >= settings.LOCATION_INGEST_MAX_BUFFERED
+            if not full:
+                self._schedule()
+
+        if full or settings.LOCATION_INGEST_FLUSH_INTERVAL <= 0:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes and clears all pending updates. Returns the number changed.
+
+        If the write fails the batch is merged back, without overriding newer
+        updates that arrived meanwhile, and the error is raised.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            return write_locations(list(pending.values()))
+        except Exception:
+            with self._lock:
+                self._merge(pending.values(), replace_equal=False)
+                self._schedule()
+            raise
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to flush buffered location updates, will retry")
+        finally:
+            connection.close()
+
+    def flush_on_exit(self):
+        """Stops the timer and writes what is still pending before the process exits."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception(
+                "Dropped %s buffered location updates on shutdown", len(self._pending)
+            )
+
+    def __len__(self):
+        return len(self._pending)
+
+
+location_buffer = LocationBuffer()
+atexit.register(location_buffer.flush_on_exit)
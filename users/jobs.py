@@ -0,0 +1,201 @@
+import logging
+import threading
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .emails import try_send_invitations
+from .models import BulkJob, CustomUser
+from .purge import purge_sessions, purge_users_chunk
+
+logger = logging.getLogger(__name__)
+
+
+def deactivate_users(job, user_ids):
+    """Deactivates a chunk of users with one UPDATE."""
+    CustomUser.objects.filter(pk__in=user_ids).update(is_active=False)
+
+
+def reactivate_users(job, user_ids):
+    """Reactivates a chunk of users with one UPDATE."""
+    CustomUser.objects.filter(pk__in=user_ids).update(is_active=True)
+
+
+def reinvite_users(job, user_ids):
+    """
+    Re-sends invitations to a chunk of users over one mail connection.
+
+    Returns:
+        int: The number of invitations that could not be sent.
+    """
+    sent, failed = try_send_invitations(
+        CustomUser.objects.filter(pk__in=user_ids), job.params["base_url"]
+    )
+    return failed
+
+
+JOB_HANDLERS = {
+    BulkJob.DEACTIVATE: deactivate_users,
+    BulkJob.REACTIVATE: reactivate_users,
+    BulkJob.REINVITE: reinvite_users,
+    BulkJob.PURGE: purge_users_chunk,
+}
+
+# Run once before the first chunk of a job.
+JOB_SETUP = {
+    BulkJob.PURGE: purge_sessions,
+}
+
+# Settings that override BULK_JOB_CHUNK_SIZE for a kind of job.
+JOB_CHUNK_SIZE_SETTINGS = {
+    BulkJob.REINVITE: "BULK_INVITE_CHUNK_SIZE",
+    BulkJob.PURGE: "PURGE_CHUNK_SIZE",
+}
+
+# Kinds whose chunks are not wrapped in a transaction, because they have side
+# effects outside the database that a rollback cannot undo. Their progress is
+# committed right after each chunk instead.
+NON_ATOMIC_KINDS = {BulkJob.REINVITE}
+
+
+def enqueue_job(kind, user_ids, created_by=None, **params):
+    """
+    Queues a bulk job and, unless ``BULK_JOB_RUN_IN_PROCESS`` is off, starts a
+    worker thread for it once the current transaction commits. Otherwise the
+    job waits for ``manage.py run_bulk_jobs``.
+
+    Returns:
+        BulkJob: The queued job.
+    """
+    user_ids = list(user_ids)
+    job = BulkJob.objects.create(
+        kind=kind,
+        user_ids=user_ids,
+        params=params,
+        total=len(user_ids),
+        created_by=created_by,
+    )
+    if settings.BULK_JOB_RUN_IN_PROCESS:
+        transaction.on_commit(lambda: _start_worker(job.pk))
+    return job
+
+
+def _start_worker(job_id):
+    """Runs the job in a daemon thread with its own database connection."""
+    def work():
+        try:
+            run_job(job_id)
+        finally:
+            connection.close()
+
+    threading.Thread(target=work, name=f"bulk-job-{job_id}", daemon=True).start()
+
+
+class JobReclaimed(Exception):
+    """The job was requeued as stale and claimed by another worker."""
+
+
+def run_job(job_id):
+    """
+    Runs a queued job in chunks of ``BULK_JOB_CHUNK_SIZE`` users (or the
+    kind's own chunk size setting).
+
+    Each chunk is committed on its own together with the progress counter,
+    so row locks are held only briefly and a failed job keeps the work done
+    so far. Chunks of ``NON_ATOMIC_KINDS`` run outside a transaction, e.g. so
+    an SMTP server is not waited on with the transaction open. Handlers may
+    return how many users of the chunk failed, which is added to ``failed``.
+    A job already claimed by another worker is left alone.
+
+    Every commit also moves ``heartbeat_at`` forward, and only succeeds if
+    the heartbeat is still the one this worker wrote. A worker whose job was
+    requeued as stale therefore rolls back its chunk and stops, rather than
+    processing users twice alongside the worker that took over.
+
+    Returns:
+        bool: Whether this call ran the job.
+    """
+    heartbeat = timezone.now()
+    claimed = BulkJob.objects.filter(pk=job_id, status=BulkJob.QUEUED).update(
+        status=BulkJob.RUNNING, started_at=heartbeat, heartbeat_at=heartbeat
+    )
+    if not claimed:
+        return False
+
+    job = BulkJob.objects.get(pk=job_id)
+    handler = JOB_HANDLERS[job.kind]
+    chunk_size = getattr(
+        settings, JOB_CHUNK_SIZE_SETTINGS.get(job.kind, "BULK_JOB_CHUNK_SIZE")
+    )
+    remaining = job.user_ids[job.processed:]
+    atomic = nullcontext if job.kind in NON_ATOMIC_KINDS else transaction.atomic
+
+    try:
+        if job.kind in JOB_SETUP and not job.processed:
+            JOB_SETUP[job.kind](job)
+        for start in range(0, len(remaining), chunk_size):
+            chunk = remaining[start:start + chunk_size]
+            with atomic():
+                failed = handler(job, chunk) or 0
+                beat = timezone.now()
+                updated = BulkJob.objects.filter(pk=job_id, heartbeat_at=heartbeat).update(
+                    processed=F("processed") + len(chunk),
+                    failed=F("failed") + failed,
+                    heartbeat_at=beat,
+                )
+                if not updated:
+                    raise JobReclaimed
+            heartbeat = beat
+    except JobReclaimed:
+        logger.warning("Bulk job %s was reclaimed by another worker", job_id)
+    except Exception as e:
+        logger.exception("Bulk job %s failed", job_id)
+        BulkJob.objects.filter(pk=job_id, heartbeat_at=heartbeat).update(
+            status=BulkJob.FAILED, error=str(e), finished_at=timezone.now()
+        )
+    else:
+        BulkJob.objects.filter(pk=job_id, heartbeat_at=heartbeat).update(
+            status=BulkJob.DONE, finished_at=timezone.now()
+        )
+    return True
+
+
+def _stale():
+    """Matches running jobs with no progress for ``BULK_JOB_STALE_AFTER`` seconds."""
+    cutoff = timezone.now() - timedelta(seconds=settings.BULK_JOB_STALE_AFTER)
+    return Q(status=BulkJob.RUNNING, heartbeat_at__lt=cutoff)
+
+
+def requeue_stale_jobs():
+    """
+    Requeues running jobs whose worker died, e.g. in a restart or deploy, so
+    they resume from the last committed chunk.
+
+    Returns:
+        int: The number of jobs requeued.
+    """
+    return BulkJob.objects.filter(_stale()).update(status=BulkJob.QUEUED)
+
+
+def requeue_jobs(queryset):
+    """
+    Requeues the failed and stale jobs in ``queryset`` and, with
+    ``BULK_JOB_RUN_IN_PROCESS`` on, starts workers for them.
+
+    Returns:
+        int: The number of jobs requeued.
+    """
+    job_ids = list(
+        queryset.filter(Q(status=BulkJob.FAILED) | _stale()).values_list("pk", flat=True)
+    )
+    requeued = BulkJob.objects.filter(pk__in=job_ids).filter(
+        Q(status=BulkJob.FAILED) | _stale()
+    ).update(status=BulkJob.QUEUED, error="", finished_at=None)
+    if settings.BULK_JOB_RUN_IN_PROCESS:
+        for job_id in job_ids:
+            transaction.on_commit(lambda job_id=job_id: _start_worker(job_id))
+    return requeued
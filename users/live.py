@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+import threading
+
+import psycopg
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "user_locations"
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more.
+MAX_PAYLOAD_BYTES = 7500
+
+# Diffs queued per viewer before it is told to reload instead.
+MAX_QUEUED_MESSAGES = 100
+
+
+def move_diff(user_id, lon, lat):
+    """Returns a diff that moves (or adds) a user's marker."""
+    return {
+        "op": "move",
+        "id": user_id,
+        "geometry": {"type": "Point", "coordinates": [lon, lat]},
+    }
+
+
+def feature_diff(op, profile):
+    """Returns an add or move diff carrying the profile's full feature."""
+    return {"op": op, **profile.as_feature()}
+
+
+def remove_diff(user_id):
+    """Returns a diff that removes a user's marker."""
+    return {"op": "remove", "id": user_id}
+
+
+def _payloads(diffs):
+    """Splits diffs into JSON lists that each fit in one NOTIFY payload."""
+    batch, size = [], 2
+    for diff in diffs:
+        encoded = json.dumps(diff)
+        if batch and size + len(encoded) + 1 > MAX_PAYLOAD_BYTES:
+            yield "[" + ",".join(batch) + "]"
+            batch, size = [], 2
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        yield "[" + ",".join(batch) + "]"
+
+
+def publish(diffs):
+    """
+    Sends map diffs to every live map viewer once the current transaction commits.
+
+    On PostgreSQL the diffs go through ``pg_notify`` so viewers connected to
+    any process receive them; NOTIFY is itself delivered on commit. Other
+    databases only reach viewers of the current process.
+    """
+    if not diffs:
+        return
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            for payload in _payloads(diffs):
+                cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+    else:
+        transaction.on_commit(lambda: change_feed.broadcast(diffs))
+
+
+class ChangeFeed:
+    """
+    Fans map diffs out to the live map streams of this process.
+
+    Each stream subscribes with its own asyncio queue. On PostgreSQL a single
+    ``LISTEN`` connection per process feeds every subscriber, so the number of
+    viewers does not add database load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._listener = None
+
+    def subscribe(self):
+        """Returns a new queue that receives lists of diffs."""
+        queue = asyncio.Queue(maxsize=MAX_QUEUED_MESSAGES)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        """Stops delivering diffs to ``queue``."""
+        with self._lock:
+            self._subscribers = {
+                (loop, q) for loop, q in self._subscribers if q is not queue
+            }
+
+    def broadcast(self, diffs):
+        """Queues diffs for every subscriber. Safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, diffs)
+            except RuntimeError:
+                # The subscriber's event loop has already closed.
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _put(queue, diffs):
+        try:
+            queue.put_nowait(diffs)
+        except asyncio.QueueFull:
+            # The viewer has fallen behind, so have it reload the full map.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait([{"op": "reset"}])
+
+    def start_listener(self):
+        """Starts the shared LISTEN task on PostgreSQL if it is not running."""
+        if connection.vendor != "postgresql":
+            return
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        settings_dict = connection.settings_dict
+        params = {
+            "dbname": settings_dict["NAME"],
+            "user": settings_dict["USER"],
+            "password": settings_dict["PASSWORD"],
+            "host": settings_dict["HOST"],
+            "port": settings_dict["PORT"],
+        }
+        params = {key: value for key, value in params.items() if value}
+
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    autocommit=True, **params
+                ) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    async for notify in conn.notifies():
+                        self.broadcast(json.loads(notify.payload))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Live map listener failed, reconnecting")
+                await asyncio.sleep(5)
+
+
+change_feed = ChangeFeed()
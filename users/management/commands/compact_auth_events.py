@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.retention import prune_auth_events, rollup_auth_events
+
+
+class Command(BaseCommand):
+    help = "Roll up login/logout events into hourly aggregates and prune old raw rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=settings.AUTH_EVENT_RETENTION_DAYS,
+            help="Keep raw auth events newer than this many days.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.AUTH_EVENT_BATCH_SIZE,
+            help="Number of log rows handled per transaction.",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=settings.AUTH_EVENT_ARCHIVE_DIR,
+            help="Write pruned rows to a gzipped JSON lines file in this directory.",
+        )
+        parser.add_argument(
+            "--skip-prune",
+            action="store_true",
+            help="Only update the rollups, keep all raw rows.",
+        )
+
+    def handle(self, *args, **options):
+        rolled_up = rollup_auth_events(batch_size=options["batch_size"])
+        self.stdout.write(f"Rolled up {rolled_up} auth events.")
+
+        if options["skip_prune"]:
+            return
+
+        deleted = prune_auth_events(
+            retention_days=options["retention_days"],
+            batch_size=options["batch_size"],
+            archive_dir=options["archive_dir"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} auth events."))
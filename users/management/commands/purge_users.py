@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.jobs import run_job
+from users.models import BulkJob, CustomUser
+from users.purge import purge_counts
+
+
+class Command(BaseCommand):
+    help = "Delete users and everything that belongs to them, in bounded chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_ids", nargs="*", type=int, help="Ids of users to delete.")
+        parser.add_argument(
+            "--email-domain",
+            help="Also delete every user whose email address is at this domain.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the rows that would be deleted.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["user_ids"] and not options["email_domain"]:
+            raise CommandError("Give user ids or --email-domain.")
+
+        users = CustomUser.objects.filter(pk__in=options["user_ids"])
+        if options["email_domain"]:
+            users = users | CustomUser.objects.filter(
+                email__iendswith="@" + options["email_domain"]
+            )
+
+        for label, count in purge_counts(users).items():
+            self.stdout.write(f"{label}: {count}")
+        if options["dry_run"]:
+            return
+
+        # Created directly rather than enqueued so no worker thread races us.
+        user_ids = list(users.order_by("pk").values_list("pk", flat=True))
+        job = BulkJob.objects.create(
+            kind=BulkJob.PURGE, user_ids=user_ids, total=len(user_ids)
+        )
+        run_job(job.pk)
+        job.refresh_from_db()
+        if job.status == BulkJob.FAILED:
+            raise CommandError(f"Purge failed after {job.processed} users: {job.error}")
+        self.stdout.write(self.style.SUCCESS(f"Purged {job.processed} users."))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.jobs import requeue_stale_jobs, run_job
+from users.models import BulkJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued bulk user jobs, e.g. when BULK_JOB_RUN_IN_PROCESS is off, and "
+        "resume jobs whose worker stopped without finishing them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new jobs instead of exiting when the queue is empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds between polls with --loop.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} stalled jobs.")
+            job_ids = list(
+                BulkJob.objects.filter(status=BulkJob.QUEUED)
+                .order_by("created_at")
+                .values_list("pk", flat=True)
+            )
+            for job_id in job_ids:
+                if run_job(job_id):
+                    job = BulkJob.objects.get(pk=job_id)
+                    self.stdout.write(f"{job}: {job.get_status_display()}")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
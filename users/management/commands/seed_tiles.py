@@ -0,0 +1,139 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.tiles import (
+    fetch_tile,
+    has_tile,
+    open_mbtiles,
+    parse_bounds,
+    tiles_in_bbox,
+    write_tile,
+)
+
+
+class Command(BaseCommand):
+    help = "Download the base map tiles covering a bounding box into the MBTiles file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bbox",
+            required=True,
+            help="Bounding box as min_lon,min_lat,max_lon,max_lat.",
+        )
+        parser.add_argument("--min-zoom", type=int, default=0)
+        parser.add_argument("--max-zoom", type=int, default=12)
+        parser.add_argument(
+            "--mbtiles",
+            default=settings.MAP_TILES_MBTILES,
+            help="MBTiles file to write (defaults to MAP_TILES_MBTILES).",
+        )
+        parser.add_argument(
+            "--url",
+            default=settings.MAP_TILES_UPSTREAM_URL,
+            help=(
+                "Upstream tile URL template with {z}, {x} and {y} (defaults to "
+                "MAP_TILES_UPSTREAM_URL). Must be a server that allows bulk downloads."
+            ),
+        )
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=0.1,
+            help="Seconds to wait between downloads, to respect upstream usage policies.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Download tiles again even if they are already stored.",
+        )
+
+    def merged_metadata(self, db, tile_format, bbox, min_zoom, max_zoom):
+        """
+        Returns metadata rows covering both this run and earlier seeding, so
+        seeding a second region does not stop misses in the first being proxied.
+        """
+        existing = dict(db.execute("SELECT name, value FROM metadata"))
+        try:
+            old_bbox = parse_bounds(existing["bounds"])
+            min_zoom = min(min_zoom, int(existing["minzoom"]))
+            max_zoom = max(max_zoom, int(existing["maxzoom"]))
+        except (KeyError, ValueError):
+            pass
+        else:
+            bbox = (
+                min(bbox[0], old_bbox[0]),
+                min(bbox[1], old_bbox[1]),
+                max(bbox[2], old_bbox[2]),
+                max(bbox[3], old_bbox[3]),
+            )
+        return [
+            ("name", "portfolio base map"),
+            ("format", tile_format),
+            ("bounds", ",".join(str(value) for value in bbox)),
+            ("minzoom", str(min_zoom)),
+            ("maxzoom", str(max_zoom)),
+        ]
+
+    def handle(self, *args, **options):
+        if not options["mbtiles"]:
+            raise CommandError("Set MAP_TILES_MBTILES or pass --mbtiles.")
+        if not options["url"]:
+            raise CommandError(
+                "Set MAP_TILES_UPSTREAM_URL or pass --url. tile.openstreetmap.org "
+                "does not allow bulk downloads; use a provider that does."
+            )
+        if not settings.MAP_TILES_CONTACT:
+            raise CommandError(
+                "Set MAP_TILES_CONTACT to an email address or URL so the tile "
+                "provider can reach you."
+            )
+        try:
+            min_lon, min_lat, max_lon, max_lat = map(float, options["bbox"].split(","))
+        except ValueError:
+            raise CommandError("--bbox must be min_lon,min_lat,max_lon,max_lat.") from None
+        if not options["min_zoom"] <= options["max_zoom"] <= 22:
+            raise CommandError("Zoom levels must satisfy min-zoom <= max-zoom <= 22.")
+
+        db = open_mbtiles(options["mbtiles"], writable=True)
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                self.merged_metadata(
+                    db,
+                    options["url"].rsplit(".", 1)[-1].lower(),
+                    (min_lon, min_lat, max_lon, max_lat),
+                    options["min_zoom"],
+                    options["max_zoom"],
+                ),
+            )
+
+        downloaded = skipped = failed = 0
+        try:
+            for zoom in range(options["min_zoom"], options["max_zoom"] + 1):
+                for x, y in tiles_in_bbox(min_lon, min_lat, max_lon, max_lat, zoom):
+                    if not options["force"] and has_tile(db, zoom, x, y):
+                        skipped += 1
+                        continue
+                    try:
+                        data = fetch_tile(options["url"], zoom, x, y)
+                    except OSError as e:
+                        self.stderr.write(f"Failed to fetch {zoom}/{x}/{y}: {e}")
+                        failed += 1
+                        continue
+                    write_tile(db, zoom, x, y, data)
+                    downloaded += 1
+                    if downloaded % 500 == 0:
+                        db.commit()
+                        self.stdout.write(f"Downloaded {downloaded} tiles...")
+                    time.sleep(options["delay"])
+            db.commit()
+        finally:
+            db.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Downloaded {downloaded} tiles, skipped {skipped}, failed {failed}."
+            )
+        )
@@ -0,0 +1,114 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .profiling import (
+    aprofile_request,
+    aprofiling_trigger,
+    profile_request,
+    profiling_trigger,
+)
+from .routers import pin_to_primary, unpin
+
+PIN_COOKIE = "db_pin_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+
+class ReplicaPinningMiddleware:
+    """
+    Keeps a client on the primary database for a short while after it writes.
+
+    A successful unsafe request (e.g. saving a profile) sets a cookie for
+    ``REPLICA_PIN_SECONDS``. While it is valid, and for the rest of any
+    request that writes, reads skip the replicas so the client always sees
+    its own changes even if replication lags. Works in both sync and async
+    middleware chains, since pinning is held in a context variable.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = self._pin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            unpin(token)
+        return self._set_pin_cookie(request, response)
+
+    async def __acall__(self, request):
+        token = self._pin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            unpin(token)
+        return self._set_pin_cookie(request, response)
+
+    def _pin(self, request):
+        """Pins reads to the primary for unsafe requests and pinned clients."""
+        unsafe = request.method not in SAFE_METHODS
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        return pin_to_primary(unsafe or pinned_until > time.time())
+
+    def _set_pin_cookie(self, request, response):
+        """Keeps the client pinned for a while after a successful write."""
+        if request.method not in SAFE_METHODS and response.status_code < 500:
+            response.set_cookie(
+                PIN_COOKIE,
+                str(int(time.time() + settings.REPLICA_PIN_SECONDS)),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests on demand and stores the results for the admin.
+
+    Staff turn it on per request with a signed token from the "Request
+    profiles" admin page, passed in the ``X-Profile-Token`` header or the
+    ``_profile`` query parameter. ``PROFILING_SAMPLE_RATE`` additionally
+    profiles a random share of all requests. Unless ``PROFILING_ENABLED`` is
+    set the middleware removes itself at startup, so it costs nothing. In an
+    async chain only profiled requests leave the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        trigger, user_id = profiling_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        return profile_request(self.get_response, request, trigger, user_id)
+
+    async def __acall__(self, request):
+        trigger, user_id = await aprofiling_trigger(request)
+        if trigger is None:
+            return await self.get_response(request)
+        return await aprofile_request(self.get_response, request, trigger, user_id)
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_authevent_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='location_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
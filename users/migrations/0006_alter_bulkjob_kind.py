@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_bulkjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bulkjob',
+            name='kind',
+            field=models.CharField(choices=[('deactivate', 'Deactivate users'), ('reactivate', 'Reactivate users'), ('reinvite', 'Re-send invitations'), ('purge', 'Delete users and their data')], max_length=20),
+        ),
+    ]
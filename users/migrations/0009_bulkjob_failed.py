@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_bulkjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkjob',
+            name='failed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import json
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.contrib.gis.db import models as geomodels
@@ -27,12 +29,213 @@ class UserProfile(models.Model):
         home_address (TextField): The home address of the user.
         phone_number (CharField): The phone number of the user.
         location (PointField): The geographic location of the user.
+        location_updated_at (DateTimeField): Device timestamp of the latest ingested location.
     """
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     home_address = models.TextField(null=True)
     phone_number = PhoneNumberField(null=True, blank=True)
     location = geomodels.PointField(null=True)
+    location_updated_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         """Returns the username of the associated user."""
         return self.user.username
+
+    def as_feature(self):
+        """Returns the profile as a GeoJSON Feature for the user map, keyed by user id."""
+        return {
+            "type": "Feature",
+            "id": self.user_id,
+            "geometry": json.loads(self.location.geojson) if self.location else None,
+            "properties": {
+                "username": self.user.username,
+                "first_name": self.user.first_name,
+                "last_name": self.user.last_name,
+                "email": self.user.email,
+                "home_address": self.home_address or "N/A",
+                "phone_number": str(self.phone_number) if self.phone_number else "N/A",
+            },
+        }
+
+
+class AuthEventRollup(models.Model):
+    """
+    Hourly login/logout counts for a single user.
+
+    Raw auth events in ``django_admin_log`` are folded into these rows by
+    ``users.retention.rollup_auth_events`` so that reporting never has to
+    scan the log table.
+
+    Attributes:
+        user (ForeignKey): The user the events belong to.
+        period_start (DateTimeField): Start of the hour the events fall into.
+        logins (PositiveIntegerField): Number of logins in the hour.
+        logouts (PositiveIntegerField): Number of logouts in the hour.
+        last_seen (DateTimeField): Time of the latest event in the hour.
+    """
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="auth_event_rollups"
+    )
+    period_start = models.DateTimeField()
+    logins = models.PositiveIntegerField(default=0)
+    logouts = models.PositiveIntegerField(default=0)
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "period_start"], name="unique_auth_rollup_period"
+            ),
+        ]
+        indexes = [models.Index(fields=["period_start"], name="users_auth_period_idx")]
+
+    def __str__(self):
+        """Returns the user and the hour the rollup covers."""
+        return f"{self.user_id} @ {self.period_start:%Y-%m-%d %H:00}"
+
+
+class AuthEventCheckpoint(models.Model):
+    """
+    Single-row bookmark of the last ``django_admin_log`` row rolled up.
+
+    Attributes:
+        last_log_id (BigIntegerField): Primary key of the last rolled up log entry.
+        updated_at (DateTimeField): When the rollup last advanced.
+    """
+    last_log_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def load(cls):
+        """Returns the checkpoint row, creating it on first use."""
+        checkpoint, _ = cls.objects.get_or_create(pk=1)
+        return checkpoint
+
+
+class BulkJob(models.Model):
+    """
+    A bulk operation on many users, processed in chunks by a background worker.
+
+    Attributes:
+        kind (CharField): The operation to run.
+        status (CharField): Queued, running, done or failed.
+        user_ids (JSONField): Primary keys of the users to process.
+        params (JSONField): Extra arguments for the operation.
+        total (PositiveIntegerField): Number of users to process.
+        processed (PositiveIntegerField): Number of users processed so far.
+        failed (PositiveIntegerField): Number of processed users the operation
+            failed for, e.g. invitations that could not be sent.
+        error (TextField): The error that stopped a failed job.
+        created_by (ForeignKey): The admin who started the job.
+        created_at (DateTimeField): When the job was queued.
+        started_at (DateTimeField): When a worker picked the job up.
+        heartbeat_at (DateTimeField): When the running worker last made progress.
+        finished_at (DateTimeField): When the job finished or failed.
+    """
+    DEACTIVATE = "deactivate"
+    REACTIVATE = "reactivate"
+    REINVITE = "reinvite"
+    PURGE = "purge"
+    KIND_CHOICES = [
+        (DEACTIVATE, "Deactivate users"),
+        (REACTIVATE, "Reactivate users"),
+        (REINVITE, "Re-send invitations"),
+        (PURGE, "Delete users and their data"),
+    ]
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    user_ids = models.JSONField(default=list)
+    params = models.JSONField(default=dict, blank=True)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        """Returns the operation and its progress."""
+        return f"{self.get_kind_display()} ({self.processed}/{self.total})"
+
+    @property
+    def percent(self):
+        """Returns the share of users processed, from 0 to 100."""
+        return round(self.processed * 100 / self.total) if self.total else 100
+
+
+class RequestProfile(models.Model):
+    """
+    A profile of one request, captured by ``ProfilingMiddleware``.
+
+    Attributes:
+        method (CharField): The HTTP method.
+        path (CharField): The request path and query string.
+        view_name (CharField): The resolved URL name, if any.
+        status_code (PositiveSmallIntegerField): The response status.
+        trigger (CharField): Whether staff asked for the profile or it was sampled.
+        user (ForeignKey): The staff member whose token requested the profile.
+        duration_ms (FloatField): Wall-clock time spent handling the request.
+        query_count (PositiveIntegerField): Number of SQL queries issued.
+        query_time_ms (FloatField): Time spent in those queries.
+        queries (JSONField): The queries with their database alias and duration.
+        stats (BinaryField): Marshalled cProfile stats, loadable with pstats.
+        folded_stacks (TextField): Sampled call stacks in folded flame graph format.
+        created_at (DateTimeField): When the request was profiled.
+    """
+    REQUESTED = "requested"
+    SAMPLED = "sampled"
+    TRIGGER_CHOICES = [
+        (REQUESTED, "Requested"),
+        (SAMPLED, "Sampled"),
+    ]
+
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2048)
+    view_name = models.CharField(max_length=255, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(default=0)
+    query_time_ms = models.FloatField(default=0)
+    queries = models.JSONField(default=list, blank=True)
+    stats = models.BinaryField()
+    folded_stacks = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        """Returns the request line and how long it took."""
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,263 @@
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+from .models import CustomUser, RequestProfile
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = "X-Profile-Token"
+TOKEN_PARAM = "_profile"
+TOKEN_SALT = "users.profiling"
+
+# One profiled request at a time per process; others are served unprofiled.
+_lock = threading.Lock()
+
+
+def make_token(user):
+    """Returns a signed token that turns on profiling for the requests carrying it."""
+    return signing.dumps(user.pk, salt=TOKEN_SALT)
+
+
+def token_user_id(token):
+    """
+    Returns the id of the active staff member a token was issued to, or None
+    if the token is invalid, expired or its owner is no longer staff.
+    """
+    try:
+        user_id = signing.loads(
+            token, salt=TOKEN_SALT, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+    if not CustomUser.objects.filter(pk=user_id, is_staff=True, is_active=True).exists():
+        return None
+    return user_id
+
+
+def profiling_trigger(request):
+    """
+    Decides whether to profile a request.
+
+    A token passed as a query parameter is removed from ``request.GET`` so
+    views that treat unknown parameters as filters, like admin changelists,
+    behave as usual.
+
+    Returns:
+        tuple: ``(trigger, user_id)``, with ``trigger`` None when the request
+            should not be profiled.
+    """
+    token = _take_token(request)
+    if token:
+        user_id = token_user_id(token)
+        if user_id is not None:
+            return RequestProfile.REQUESTED, user_id
+    if random.random() < settings.PROFILING_SAMPLE_RATE:
+        return RequestProfile.SAMPLED, None
+    return None, None
+
+
+async def aprofiling_trigger(request):
+    """Async version of ``profiling_trigger``; only a token costs a thread hop."""
+    token = _take_token(request)
+    if token:
+        user_id = await sync_to_async(token_user_id)(token)
+        if user_id is not None:
+            return RequestProfile.REQUESTED, user_id
+    if random.random() < settings.PROFILING_SAMPLE_RATE:
+        return RequestProfile.SAMPLED, None
+    return None, None
+
+
+def _take_token(request):
+    """Returns the request's profiling token, removing it from ``request.GET``."""
+    token = request.headers.get(TOKEN_HEADER)
+    if TOKEN_PARAM in request.GET:
+        request.GET = request.GET.copy()
+        param_token = request.GET.pop(TOKEN_PARAM)[-1]
+        token = token or param_token
+    return token
+
+
+def _fold(frame):
+    """Returns a frame's call stack as ``outer;...;inner`` for flame graphs."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}.{code.co_name}:{code.co_firstlineno}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    Samples the call stack of one thread from a background thread.
+
+    Sampling catches time spent waiting, e.g. on the database, which cProfile
+    attributes poorly, and gives the call paths a flame graph needs.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        """Starts sampling."""
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling and waits for the sampler thread to exit."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[_fold(frame)] += 1
+
+    def folded(self):
+        """Returns the samples in folded format, one ``stack count`` per line."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+class QueryRecorder:
+    """Database execute wrapper that records each query and its duration."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "alias": self.alias,
+                "sql": sql,
+                "ms": round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+def profile_request(get_response, request, trigger, user_id):
+    """
+    Handles a request under cProfile, a stack sampler and SQL recording, and
+    stores the result as a ``RequestProfile``.
+
+    Streaming responses are returned without a profile, since their body is
+    produced after the view returns.
+    """
+    if not _lock.acquire(blocking=False):
+        return get_response(request)
+
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL)
+    recorders = [QueryRecorder(alias) for alias in connections]
+    try:
+        with ExitStack() as stack:
+            for recorder in recorders:
+                stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+            sampler.start()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = get_response(request)
+            finally:
+                profiler.disable()
+                duration = time.perf_counter() - start
+                sampler.stop()
+    finally:
+        _lock.release()
+
+    if getattr(response, "streaming", False):
+        return response
+
+    queries = [query for recorder in recorders for query in recorder.queries]
+    profiler.create_stats()
+    match = request.resolver_match
+    try:
+        RequestProfile.objects.create(
+            method=request.method,
+            path=_path_without_token(request)[:2048],
+            view_name=(match.view_name if match else "")[:255],
+            status_code=response.status_code,
+            trigger=trigger,
+            user_id=user_id,
+            duration_ms=duration * 1000,
+            query_count=len(queries),
+            query_time_ms=sum(query["ms"] for query in queries),
+            queries=queries[:settings.PROFILING_MAX_QUERIES],
+            stats=marshal.dumps(profiler.stats),
+            folded_stacks=sampler.folded(),
+        )
+        prune_profiles()
+    except Exception:
+        # A failed profile must never fail the request it describes.
+        logger.exception("Could not store profile of %s", request.path)
+    return response
+
+
+async def aprofile_request(get_response, request, trigger, user_id):
+    """
+    Profiles a request in an async middleware chain.
+
+    cProfile and the stack sampler follow one thread, so the request is
+    handled through ``profile_request`` in a worker thread. Sync views are
+    run back on that thread by asgiref, so they are profiled as usual.
+    """
+    return await sync_to_async(profile_request)(
+        async_to_sync(get_response), request, trigger, user_id
+    )
+
+
+def _path_without_token(request):
+    """Returns the request path with the query string left after ``profiling_trigger``."""
+    query = request.GET.urlencode()
+    return f"{request.path}?{query}" if query else request.path
+
+
+def prune_profiles():
+    """Deletes all but the newest ``PROFILING_MAX_PROFILES`` profiles."""
+    stale = list(
+        RequestProfile.objects.order_by("-pk").values_list("pk", flat=True)[
+            settings.PROFILING_MAX_PROFILES:
+        ]
+    )
+    if stale:
+        RequestProfile.objects.filter(pk__in=stale).delete()
+
+
+class _MarshalledStats:
+    """Adapts marshalled stats to what ``pstats.Stats`` loads from a profiler."""
+
+    def __init__(self, data):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+
+def stats_summary(profile, limit=40):
+    """Returns the top functions of a stored profile by cumulative time."""
+    out = io.StringIO()
+    stats = pstats.Stats(_MarshalledStats(bytes(profile.stats)), stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return out.getvalue()
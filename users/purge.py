@@ -0,0 +1,126 @@
+import logging
+
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.models import Session
+from django.db.models import CharField, Q
+from django.db.models.functions import Cast
+
+from .models import AuthEventRollup, BulkJob, CustomUser, UserProfile
+
+logger = logging.getLogger(__name__)
+
+SESSION_USER_KEY = "_auth_user_id"
+
+
+def purge_steps(users):
+    """
+    Returns ``(label, queryset)`` pairs for everything a purge removes, in the
+    order it must be deleted.
+
+    Args:
+        users (list | QuerySet): User ids, or a queryset of users. With a
+            queryset every count is a single SQL query and no rows are loaded.
+
+    Returns:
+        list[tuple[str, QuerySet]]: Dependents first, the users themselves last.
+    """
+    if isinstance(users, list):
+        object_ids = [str(user_id) for user_id in users]
+    else:
+        object_ids = users.annotate(
+            object_id=Cast("pk", output_field=CharField())
+        ).values("object_id")
+    user_type = ContentType.objects.get_for_model(CustomUser)
+
+    return [
+        (
+            "admin log entries",
+            LogEntry.objects.filter(
+                Q(user__in=users) | Q(content_type=user_type, object_id__in=object_ids)
+            ),
+        ),
+        ("auth event rollups", AuthEventRollup.objects.filter(user__in=users)),
+        ("profiles", UserProfile.objects.filter(user__in=users)),
+        (
+            "group memberships",
+            CustomUser.groups.through.objects.filter(customuser__in=users),
+        ),
+        (
+            "user permissions",
+            CustomUser.user_permissions.through.objects.filter(customuser__in=users),
+        ),
+        ("users", CustomUser.objects.filter(pk__in=users)),
+    ]
+
+
+def purge_counts(users):
+    """
+    Counts what purging ``users`` would delete, without deleting or loading
+    any rows. Sessions are not counted because finding them means decoding
+    every session.
+
+    Returns:
+        dict[str, int]: Row counts keyed by step label.
+    """
+    return {label: queryset.count() for label, queryset in purge_steps(users)}
+
+
+def _delete_in_batches(queryset, batch_size):
+    """Deletes matching rows by primary key, at most ``batch_size`` per statement."""
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by().values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        count, _ = queryset.model.objects.filter(pk__in=pks).delete()
+        deleted += count
+
+
+def purge_users_chunk(job, user_ids):
+    """
+    Deletes a chunk of users and everything depending on them.
+
+    Runs inside the job's per-chunk transaction, so ``PURGE_CHUNK_SIZE``
+    bounds how long rows stay locked. Bulk jobs the users created are kept
+    but unlinked, and each dependent table is emptied in bounded batches
+    before the users themselves are deleted, so the final user delete finds
+    nothing left to cascade.
+    """
+    batch_size = settings.PURGE_BATCH_SIZE
+    BulkJob.objects.filter(created_by__in=user_ids).update(created_by=None)
+    for label, queryset in purge_steps(user_ids):
+        deleted = _delete_in_batches(queryset, batch_size)
+        logger.info("Purge job %s deleted %s %s", job.pk, deleted, label)
+
+
+def purge_sessions(job):
+    """
+    Deletes database sessions that belong to the job's users.
+
+    Session data is encoded, so the session table is scanned once in
+    batches and each session decoded. Other session engines are skipped;
+    their sessions stop authenticating once the user is gone.
+    """
+    if settings.SESSION_ENGINE != "django.contrib.sessions.backends.db":
+        return
+    user_ids = {str(user_id) for user_id in job.user_ids}
+    batch_size = settings.PURGE_BATCH_SIZE
+    last_key = ""
+    while True:
+        sessions = list(
+            Session.objects.filter(session_key__gt=last_key).order_by("session_key")[
+                :batch_size
+            ]
+        )
+        if not sessions:
+            return
+        last_key = sessions[-1].session_key
+        expired = [
+            session.session_key
+            for session in sessions
+            if str(session.get_decoded().get(SESSION_USER_KEY)) in user_ids
+        ]
+        if expired:
+            Session.objects.filter(session_key__in=expired).delete()
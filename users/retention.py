@@ -0,0 +1,167 @@
+import gzip
+import json
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.admin.models import ADDITION, LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AuthEventCheckpoint, AuthEventRollup, CustomUser
+from .signals import LOGIN_MESSAGE, LOGOUT_MESSAGE
+
+AUTH_EVENT_COUNTERS = {LOGIN_MESSAGE: "logins", LOGOUT_MESSAGE: "logouts"}
+
+# Log rows are only rolled up once they are this old, so that a transaction
+# that took a lower primary key but committed late is not skipped.
+ROLLUP_SETTLE_TIME = timedelta(minutes=1)
+
+
+def auth_events():
+    """Returns a queryset of the login/logout rows written by ``users.signals``."""
+    return LogEntry.objects.filter(
+        content_type=ContentType.objects.get_for_model(CustomUser),
+        action_flag=ADDITION,
+        change_message__in=list(AUTH_EVENT_COUNTERS),
+    )
+
+
+def rollup_auth_events(batch_size=None):
+    """
+    Folds raw auth events newer than the checkpoint into hourly rollups.
+
+    Events are processed in primary key order, one batch per transaction, and
+    the checkpoint advances with each batch so the rollup can be re-run at any
+    time without double counting.
+
+    Args:
+        batch_size (int): Number of log rows to fold per transaction.
+
+    Returns:
+        int: The number of log rows rolled up.
+    """
+    batch_size = batch_size or settings.AUTH_EVENT_BATCH_SIZE
+    settled = timezone.now() - ROLLUP_SETTLE_TIME
+    AuthEventCheckpoint.load()
+    total = 0
+
+    while True:
+        with transaction.atomic():
+            checkpoint = AuthEventCheckpoint.objects.select_for_update().get(pk=1)
+            rows = list(
+                auth_events()
+                .filter(pk__gt=checkpoint.last_log_id, action_time__lt=settled)
+                .order_by("pk")
+                .values_list("pk", "user_id", "action_time", "change_message")[
+                    :batch_size
+                ]
+            )
+            if not rows:
+                break
+
+            buckets = {}
+            for _, user_id, action_time, message in rows:
+                period_start = action_time.replace(minute=0, second=0, microsecond=0)
+                bucket = buckets.setdefault(
+                    (user_id, period_start),
+                    {"logins": 0, "logouts": 0, "last_seen": action_time},
+                )
+                bucket[AUTH_EVENT_COUNTERS[message]] += 1
+                bucket["last_seen"] = max(bucket["last_seen"], action_time)
+            _merge_rollups(buckets)
+
+            checkpoint.last_log_id = rows[-1][0]
+            checkpoint.save()
+            total += len(rows)
+
+    return total
+
+
+def _merge_rollups(buckets):
+    """Adds per-hour counts to existing rollup rows, creating missing ones."""
+    existing = {
+        (rollup.user_id, rollup.period_start): rollup
+        for rollup in AuthEventRollup.objects.filter(
+            user_id__in={user_id for user_id, _ in buckets},
+            period_start__in={period_start for _, period_start in buckets},
+        )
+    }
+
+    to_create, to_update = [], []
+    for key, counts in buckets.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            user_id, period_start = key
+            to_create.append(
+                AuthEventRollup(user_id=user_id, period_start=period_start, **counts)
+            )
+            continue
+        rollup.logins += counts["logins"]
+        rollup.logouts += counts["logouts"]
+        rollup.last_seen = max(rollup.last_seen, counts["last_seen"])
+        to_update.append(rollup)
+
+    AuthEventRollup.objects.bulk_create(to_create)
+    AuthEventRollup.objects.bulk_update(to_update, ["logins", "logouts", "last_seen"])
+
+
+def prune_auth_events(retention_days=None, batch_size=None, archive_dir=None):
+    """
+    Deletes rolled up auth events older than the retention period.
+
+    Rows are deleted by primary key in batches, each in its own short
+    transaction, so the log table is never locked for the whole run. Only rows
+    already covered by the rollup checkpoint are eligible.
+
+    Args:
+        retention_days (int): Keep raw events newer than this many days.
+        batch_size (int): Number of rows to delete per transaction.
+        archive_dir (str): If set, deleted rows are first appended to a gzipped
+            JSON lines file in this directory.
+
+    Returns:
+        int: The number of log rows deleted.
+    """
+    if retention_days is None:
+        retention_days = settings.AUTH_EVENT_RETENTION_DAYS
+    batch_size = batch_size or settings.AUTH_EVENT_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    expired = auth_events().filter(
+        pk__lte=AuthEventCheckpoint.load().last_log_id, action_time__lt=cutoff
+    )
+
+    archive = None
+    if archive_dir:
+        path = Path(archive_dir)
+        path.mkdir(parents=True, exist_ok=True)
+        archive = gzip.open(
+            path / f"auth-events-{timezone.now():%Y%m%dT%H%M%S}.jsonl.gz", "at"
+        )
+
+    deleted = 0
+    try:
+        while True:
+            rows = list(
+                expired.order_by("pk").values(
+                    "pk", "user_id", "action_time", "change_message"
+                )[:batch_size]
+            )
+            if not rows:
+                break
+            if archive:
+                for row in rows:
+                    row["action_time"] = row["action_time"].isoformat()
+                    archive.write(json.dumps(row) + "\n")
+                archive.flush()
+            with transaction.atomic():
+                count, _ = LogEntry.objects.filter(
+                    pk__in=[row["pk"] for row in rows]
+                ).delete()
+            deleted += count
+    finally:
+        if archive:
+            archive.close()
+
+    return deleted
@@ -0,0 +1,131 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+_use_replica = ContextVar("use_replica", default=False)
+_pinned_to_primary = ContextVar("pinned_to_primary", default=False)
+
+# alias -> (checked_at, lag_seconds)
+_lag_cache = {}
+
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+          OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+@contextmanager
+def read_replica():
+    """Lets reads inside the block go to a read replica."""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def use_read_replica(view_func):
+    """
+    Decorator that serves GET and HEAD requests from a read replica.
+
+    Lazy template responses are rendered inside the replica block so that
+    querysets evaluated by the template are routed too.
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return view_func(request, *args, **kwargs)
+        with read_replica():
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+        return response
+
+    return wrapper
+
+
+def pin_to_primary(pinned=True):
+    """
+    Sends all reads in the current context to the primary.
+
+    Returns:
+        Token: Pass to ``unpin`` to restore the previous state.
+    """
+    return _pinned_to_primary.set(pinned)
+
+
+def unpin(token):
+    """Restores the pinning state saved by ``pin_to_primary``."""
+    _pinned_to_primary.reset(token)
+
+
+def replica_lag(alias):
+    """
+    Returns the replication lag of ``alias`` in seconds, checked at most every
+    ``REPLICA_LAG_CHECK_INTERVAL`` seconds. Unreachable replicas report an
+    infinite lag.
+    """
+    checked_at, lag = _lag_cache.get(alias, (0, None))
+    now = time.monotonic()
+    if lag is not None and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return lag
+
+    lag = 0.0
+    if connections[alias].vendor == "postgresql":
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_QUERY)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError as e:
+            logger.warning("Could not check replication lag of %s: %s", alias, e)
+            lag = float("inf")
+    _lag_cache[alias] = (now, lag)
+    return lag
+
+
+class ReplicaRouter:
+    """
+    Routes reads to a replica inside ``read_replica`` blocks.
+
+    Everything else, writes, and any read made after a write in the same
+    request (or shortly after one by the same client, see
+    ``ReplicaPinningMiddleware``) goes to the primary. Replicas lagging more
+    than ``REPLICA_MAX_LAG`` seconds are skipped.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or _pinned_to_primary.get():
+            return None
+        healthy = [
+            alias
+            for alias in settings.READ_REPLICAS
+            if replica_lag(alias) <= settings.REPLICA_MAX_LAG
+        ]
+        return random.choice(healthy) if healthy else None
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *settings.READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.READ_REPLICAS:
+            return False
+        return None
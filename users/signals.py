@@ -1,7 +1,21 @@
 from django.contrib.admin.models import ADDITION, LogEntry
+from django.contrib.auth.models import Group, Permission
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.contrib.contenttypes.models import ContentType
-from django.dispatch import receiver
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import live
+from .backends import invalidate_all_permissions, invalidate_user_permissions
+from .models import CustomUser, UserProfile
+
+LOGIN_MESSAGE = "User logged in"
+LOGOUT_MESSAGE = "User logged out"
+
+# Sent after a batch of ingested locations is written with a bulk UPDATE,
+# which bypasses post_save. Receives ``updates``: a list of
+# (user_id, lon, lat) tuples for the profiles that actually changed.
+locations_updated = Signal()
 
 
 def log_auth_event(user, action_message):
@@ -18,9 +32,65 @@ def log_auth_event(user, action_message):
 
 @receiver(user_logged_in)
 def user_logged_in_handler(sender, request, user, **kwargs):
-    log_auth_event(user, "User logged in")
+    log_auth_event(user, LOGIN_MESSAGE)
 
 
 @receiver(user_logged_out)
 def user_logged_out_handler(sender, request, user, **kwargs):
-    log_auth_event(user, "User logged out")
+    log_auth_event(user, LOGOUT_MESSAGE)
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+def user_permissions_changed_handler(sender, instance, action, **kwargs):
+    """Drops cached permissions when a user's groups or permissions change."""
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, CustomUser):
+        invalidate_user_permissions(instance.pk)
+    else:
+        invalidate_all_permissions()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed_handler(sender, action, **kwargs):
+    """Drops all cached permissions when a group's permissions change."""
+    if action.startswith("post_"):
+        invalidate_all_permissions()
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved_handler(sender, instance, update_fields=None, **kwargs):
+    """Drops cached permissions when a user's flags may have changed."""
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    invalidate_user_permissions(instance.pk)
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def permission_deleted_handler(sender, **kwargs):
+    """Drops all cached permissions when a group or permission is removed."""
+    invalidate_all_permissions()
+
+
+@receiver(post_save, sender=UserProfile)
+def user_profile_saved_handler(sender, instance, created, **kwargs):
+    """Pushes the saved profile to live map viewers."""
+    if instance.location is None:
+        if not created:
+            live.publish([live.remove_diff(instance.user_id)])
+        return
+    live.publish([live.feature_diff("add" if created else "move", instance)])
+
+
+@receiver(post_delete, sender=UserProfile)
+def user_profile_deleted_handler(sender, instance, **kwargs):
+    """Removes a deleted profile from live map viewers."""
+    live.publish([live.remove_diff(instance.user_id)])
+
+
+@receiver(locations_updated)
+def locations_updated_handler(sender, updates, **kwargs):
+    """Pushes bulk-ingested locations to live map viewers."""
+    live.publish([live.move_diff(*update) for update in updates])
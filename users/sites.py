@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.urls import get_script_prefix
+from django.utils.translation import get_language
+
+from .backends import permission_cache_key
+
+
+class CachedAdminSite(admin.AdminSite):
+    """
+    Admin site that caches each user's app list.
+
+    ``each_context`` builds the app list for the sidebar on every admin page,
+    checking permissions for every registered model. The result only depends
+    on the user's permissions, the language and the URL prefix, so it is
+    cached per user and dropped with the permission cache. Like the
+    permission cache it is only used while ``ADMIN_CACHE_ENABLED`` is on.
+    """
+
+    def get_app_list(self, request, app_label=None):
+        """Returns the full app list from the cache when possible."""
+        if (
+            not settings.ADMIN_CACHE_ENABLED
+            or app_label is not None
+            or not request.user.is_authenticated
+        ):
+            return super().get_app_list(request, app_label)
+
+        key = "{}:{}:{}".format(
+            permission_cache_key(request.user.pk, "app-list"),
+            get_language(),
+            get_script_prefix(),
+        )
+        app_list = cache.get(key)
+        if app_list is None:
+            app_list = super().get_app_list(request)
+            # Lazy translation proxies cannot be pickled, so store plain text.
+            for app in app_list:
+                app["name"] = str(app["name"])
+                for model in app["models"]:
+                    model["name"] = str(model["name"])
+            cache.set(key, app_list, settings.ADMIN_CACHE_TIMEOUT)
+        return app_list
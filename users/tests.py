@@ -1,11 +1,54 @@
-from django.test import Client, TestCase
+import io
+import json
+import os
+import smtplib
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.gis.geos import Point
+from django.contrib.admin.models import CHANGE, LogEntry
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connections
+from django.http import HttpResponse
+from django.test import (
+    AsyncClient,
+    Client,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from .models import CustomUser, UserProfile
+from .jobs import run_job
+from .models import AuthEventRollup, BulkJob, CustomUser, RequestProfile, UserProfile
+from .ingest import LocationBuffer, LocationUpdate, write_locations
+from .live import ChangeFeed
+from .middleware import ReplicaPinningMiddleware
+from .profiling import make_token, stats_summary
+from .purge import purge_counts
+from .routers import ReplicaRouter, pin_to_primary, read_replica, unpin
+from .retention import auth_events, prune_auth_events, rollup_auth_events
+from .throttling import throttle_stats
+from .tiles import open_mbtiles, read_tile, tile_cache, tile_metadata, write_tile
 
 
 class UserLoginViewTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.login_url = reverse("login")
         self.profile_url = reverse("profile")
@@ -161,3 +204,910 @@ class LogoutViewTests(TestCase):
         self.client.login(username="testuser", password="testpass123")
         response = self.client.post(self.logout_url)
         self.assertRedirects(response, reverse("login"))
+
+
+class AuthEventRetentionTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(
+            username="testuser", password="testpass123", email="test@gmail.com"
+        )
+        self.client.login(username="testuser", password="testpass123")
+        self.client.post(reverse("logout"))
+        self.client.login(username="testuser", password="testpass123")
+        auth_events().update(action_time=timezone.now() - timedelta(days=100))
+
+    def test_rollup_counts_events(self):
+        """Test that logins and logouts are folded into one hourly rollup."""
+        self.assertEqual(rollup_auth_events(), 3)
+        rollup = AuthEventRollup.objects.get(user=self.user)
+        self.assertEqual(rollup.logins, 2)
+        self.assertEqual(rollup.logouts, 1)
+
+    def test_rollup_is_incremental(self):
+        """Test that re-running the rollup does not count events twice."""
+        rollup_auth_events()
+        self.assertEqual(rollup_auth_events(), 0)
+        self.assertEqual(AuthEventRollup.objects.get(user=self.user).logins, 2)
+
+    def test_prune_only_rolled_up_events(self):
+        """Test that raw events are kept until they have been rolled up."""
+        self.assertEqual(prune_auth_events(retention_days=90), 0)
+        rollup_auth_events()
+        self.assertEqual(prune_auth_events(retention_days=90, batch_size=2), 3)
+        self.assertFalse(auth_events().exists())
+
+    def test_prune_keeps_recent_events(self):
+        """Test that events inside the retention period are kept."""
+        rollup_auth_events()
+        self.assertEqual(prune_auth_events(retention_days=365), 0)
+        self.assertEqual(LogEntry.objects.count(), 3)
+
+    def test_dashboard_requires_admin(self):
+        """Test that only an admin can view the login activity dashboard."""
+        response = self.client.get(reverse("admin:admin_auth_dashboard"))
+        self.assertEqual(response.status_code, 302)
+
+        CustomUser.objects.create_superuser(
+            username="admin", password="adminpass123", email="admin@gmail.com"
+        )
+        self.client.login(username="admin", password="adminpass123")
+        response = self.client.get(reverse("admin:admin_auth_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "users/auth_dashboard.html")
+
+
+@override_settings(
+    LOGIN_THROTTLE_USERNAME_BURST=2,
+    LOGIN_THROTTLE_IP_BURST=100,
+    LOGIN_THROTTLE_FREE_FAILURES=1,
+)
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.login_url = reverse("login")
+        self.user = CustomUser.objects.create_user(
+            username="testuser", password="testpass123"
+        )
+        UserProfile.objects.create(user=self.user)
+
+    @override_settings(LOGIN_THROTTLE_FREE_FAILURES=10)
+    def test_username_bucket_rejects_before_authenticate(self):
+        """Test that attempts beyond the username burst never reach authenticate()."""
+        self.client.post(self.login_url, {"username": "other", "password": "x"})
+        self.client.post(self.login_url, {"username": "other", "password": "x"})
+        with mock.patch("django.contrib.auth.forms.authenticate") as authenticate:
+            response = self.client.post(
+                self.login_url, {"username": "Other", "password": "x"}
+            )
+        authenticate.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        self.assertContains(response, "Too many login attempts.", status_code=429)
+
+    @override_settings(LOGIN_THROTTLE_USERNAME_BURST=100, LOGIN_THROTTLE_IP_BURST=2)
+    def test_ip_bucket_rejects_across_usernames(self):
+        """Test that one client IP cannot spread attempts over many usernames."""
+        for username in ("a", "b"):
+            self.client.post(self.login_url, {"username": username, "password": "x"})
+        response = self.client.post(self.login_url, {"username": "c", "password": "x"})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(throttle_stats()["rejected_ip"], 1)
+
+    @override_settings(LOGIN_THROTTLE_USERNAME_BURST=100)
+    def test_progressive_delay_after_failures(self):
+        """Test that repeated failures delay even a correct password."""
+        for _ in range(2):
+            self.client.post(
+                self.login_url, {"username": "testuser", "password": "wrongpass"}
+            )
+        response = self.client.post(
+            self.login_url, {"username": "testuser", "password": "testpass123"}
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(throttle_stats()["delayed"], 1)
+
+    def test_success_clears_failures(self):
+        """Test that a successful login resets the failure count."""
+        self.client.post(self.login_url, {"username": "testuser", "password": "wrong"})
+        response = self.client.post(
+            self.login_url, {"username": "testuser", "password": "testpass123"}
+        )
+        self.assertRedirects(response, reverse("profile"))
+
+
+@override_settings(ADMIN_CACHE_ENABLED=True)
+class PermissionCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(name="editors")
+        self.permission = Permission.objects.get(codename="change_userprofile")
+        self.user = CustomUser.objects.create_user(
+            username="staffuser", password="staffpass123", is_staff=True
+        )
+        self.user.groups.add(self.group)
+
+    def fresh_user(self):
+        return CustomUser.objects.get(pk=self.user.pk)
+
+    def app_list(self):
+        request = RequestFactory().get("/admin/")
+        request.user = self.fresh_user()
+        return admin.site.get_app_list(request)
+
+    def test_permissions_are_cached_between_requests(self):
+        """Test that a new user instance reuses the cached permission sets."""
+        self.fresh_user().get_all_permissions()
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            user.has_perm("users.change_userprofile")
+
+    def test_group_permission_change_invalidates_cache(self):
+        """Test that adding a permission to a group is seen immediately."""
+        self.assertFalse(self.fresh_user().has_perm("users.change_userprofile"))
+        self.group.permissions.add(self.permission)
+        self.assertTrue(self.fresh_user().has_perm("users.change_userprofile"))
+
+    def test_app_list_follows_user_groups(self):
+        """Test that the cached admin app list changes with the user's groups."""
+        self.group.permissions.add(self.permission)
+        self.assertEqual(len(self.app_list()), 1)
+        self.user.groups.remove(self.group)
+        self.assertEqual(self.app_list(), [])
+
+    @override_settings(ADMIN_CACHE_ENABLED=False)
+    def test_no_caching_without_shared_cache(self):
+        """Test that permissions are read from the database when caching is off."""
+        self.fresh_user().get_all_permissions()
+        user = self.fresh_user()
+        with self.assertNumQueries(2):
+            user.has_perm("users.change_userprofile")
+
+
+@override_settings(LOCATION_INGEST_FLUSH_INTERVAL=0)
+class LocationIngestViewTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.ingest_url = reverse("location_ingest")
+        self.user = CustomUser.objects.create_user(
+            username="testuser", password="testpass123", email="test@gmail.com"
+        )
+        self.user_profile = UserProfile.objects.create(user=self.user)
+        self.other_user = CustomUser.objects.create_user(
+            username="otheruser", password="otherpass123", email="other@gmail.com"
+        )
+        self.other_profile = UserProfile.objects.create(user=self.other_user)
+
+    def post_updates(self, updates):
+        return self.client.post(
+            self.ingest_url,
+            json.dumps({"updates": updates}),
+            content_type="application/json",
+        )
+
+    def test_unauthenticated_user_rejected(self):
+        """Test that an anonymous client cannot ingest locations."""
+        response = self.post_updates([])
+        self.assertEqual(response.status_code, 401)
+
+    def test_latest_update_per_user_wins(self):
+        """Test that only the newest update in a batch is written."""
+        self.client.login(username="testuser", password="testpass123")
+        response = self.post_updates(
+            [
+                {"user": self.user.pk, "lon": 5, "lat": 6, "timestamp": "2026-01-01T10:00:00Z"},
+                {"user": self.user.pk, "lon": 1, "lat": 2, "timestamp": "2026-01-01T09:00:00Z"},
+            ]
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["accepted"], 2)
+        self.user_profile.refresh_from_db()
+        self.assertEqual((self.user_profile.location.x, self.user_profile.location.y), (5, 6))
+
+    def test_older_update_does_not_overwrite(self):
+        """Test that a late batch cannot move a user backwards in time."""
+        self.client.login(username="testuser", password="testpass123")
+        self.post_updates([{"user": self.user.pk, "lon": 5, "lat": 6, "timestamp": 1767261600}])
+        self.post_updates([{"user": self.user.pk, "lon": 1, "lat": 2, "timestamp": 1767258000}])
+        self.user_profile.refresh_from_db()
+        self.assertEqual(self.user_profile.location.x, 5)
+
+    def test_invalid_and_foreign_updates_rejected(self):
+        """Test that bad items and other users' locations are rejected individually."""
+        self.client.login(username="testuser", password="testpass123")
+        response = self.post_updates(
+            [
+                {"user": self.user.pk, "lon": 500, "lat": 6},
+                {"user": self.other_user.pk, "lon": 1, "lat": 2},
+                {"user": self.user.pk, "lon": 1, "lat": 2, "timestamp": 1e20},
+                {"user": self.user.pk, "lon": 1, "lat": 2},
+            ]
+        )
+        self.assertEqual(response.json()["accepted"], 1)
+        self.assertEqual([r["index"] for r in response.json()["rejected"]], [0, 1, 2])
+        self.other_profile.refresh_from_db()
+        self.assertIsNone(self.other_profile.location)
+
+    def test_user_with_permission_updates_others(self):
+        """Test that a user with change_userprofile can report any user."""
+        self.user.user_permissions.add(
+            Permission.objects.get(codename="change_userprofile")
+        )
+        self.client.login(username="testuser", password="testpass123")
+        response = self.post_updates([{"user": self.other_user.pk, "lon": 1, "lat": 2}])
+        self.assertEqual(response.json()["accepted"], 1)
+        self.other_profile.refresh_from_db()
+        self.assertEqual(self.other_profile.location.y, 2)
+
+    def test_user_without_profile_rejected(self):
+        """Test that updates for users without a profile are reported as rejected."""
+        self.user.user_permissions.add(
+            Permission.objects.get(codename="change_userprofile")
+        )
+        no_profile = CustomUser.objects.create_user(
+            username="noprofile", password="nopass123", email="noprofile@gmail.com"
+        )
+        self.client.login(username="testuser", password="testpass123")
+        response = self.post_updates(
+            [
+                {"user": no_profile.pk, "lon": 1, "lat": 2},
+                {"user": self.user.pk, "lon": 1, "lat": 2},
+            ]
+        )
+        self.assertEqual(response.json()["accepted"], 1)
+        self.assertEqual(
+            response.json()["rejected"], [{"index": 0, "error": "User has no profile."}]
+        )
+
+    @override_settings(LOCATION_INGEST_FLUSH_INTERVAL=60)
+    def test_failed_flush_is_retried(self):
+        """Test that a batch that fails to write stays buffered, newest update winning."""
+        buffer = LocationBuffer()
+        self.addCleanup(buffer.flush_on_exit)
+        now = timezone.now()
+        old = LocationUpdate(self.user.pk, 1, 2, now - timedelta(seconds=10))
+        newer = LocationUpdate(self.user.pk, 3, 4, now)
+        buffer.add([old])
+        with mock.patch("users.ingest.write_locations", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+        self.assertEqual(len(buffer), 1)
+        buffer.add([newer])
+        with mock.patch("users.ingest.write_locations", return_value=1) as write:
+            buffer.flush()
+        write.assert_called_once_with([newer])
+
+        buffer.add([newer])
+        with mock.patch("users.ingest.write_locations", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+        buffer.add([old])
+        with mock.patch("users.ingest.write_locations", return_value=1) as write:
+            buffer.flush()
+        write.assert_called_once_with([newer])
+
+
+class UserMapLiveUpdateTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.events_url = reverse("user_map_events")
+        self.user = CustomUser.objects.create_user(
+            username="testuser", password="testpass123", email="test@gmail.com"
+        )
+
+    def test_profile_changes_publish_diffs(self):
+        """Test that adding, moving and clearing a location publishes diffs."""
+        with mock.patch("users.live.publish") as publish:
+            profile = UserProfile.objects.create(
+                user=self.user, location=Point(1, 2, srid=4326)
+            )
+            profile.location = Point(3, 4, srid=4326)
+            profile.save()
+            profile.location = None
+            profile.save()
+        ops = [call.args[0][0]["op"] for call in publish.call_args_list]
+        self.assertEqual(ops, ["add", "move", "remove"])
+        self.assertEqual(publish.call_args_list[1].args[0][0]["id"], self.user.pk)
+
+    def test_bulk_ingest_publishes_moves(self):
+        """Test that locations written by the ingest buffer reach the live map."""
+        UserProfile.objects.create(user=self.user)
+        with mock.patch("users.live.publish") as publish:
+            write_locations([LocationUpdate(self.user.pk, 1.0, 2.0, timezone.now())])
+        diff = publish.call_args.args[0][0]
+        self.assertEqual(diff["op"], "move")
+        self.assertEqual(diff["geometry"]["coordinates"], [1.0, 2.0])
+
+    async def test_change_feed_fans_out(self):
+        """Test that every subscriber receives each broadcast."""
+        feed = ChangeFeed()
+        first, second = feed.subscribe(), feed.subscribe()
+        feed.broadcast([{"op": "remove", "id": 1}])
+        self.assertEqual(await first.get(), [{"op": "remove", "id": 1}])
+        self.assertEqual(await second.get(), [{"op": "remove", "id": 1}])
+        feed.unsubscribe(first)
+        feed.broadcast([{"op": "remove", "id": 2}])
+        self.assertTrue(first.empty())
+
+    def test_non_admin_user_access(self):
+        """Test that a non-admin user cannot open the event stream."""
+        self.client.login(username="testuser", password="testpass123")
+        response = self.client.get(self.events_url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_wsgi_request_does_not_stream(self):
+        """Test that the stream tells the browser not to reconnect outside ASGI."""
+        CustomUser.objects.create_superuser(
+            username="admin", password="adminpass123", email="admin@gmail.com"
+        )
+        self.client.login(username="admin", password="adminpass123")
+        response = self.client.get(self.events_url)
+        self.assertEqual(response.status_code, 204)
+
+
+@override_settings(READ_REPLICAS=["replica1"], REPLICA_MAX_LAG=10)
+@override_settings(READ_REPLICAS=["replica1"])
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        lag = mock.patch("users.routers.replica_lag", return_value=0)
+        self.replica_lag = lag.start()
+        self.addCleanup(lag.stop)
+        self.token = pin_to_primary(False)
+        self.addCleanup(unpin, self.token)
+
+    def test_reads_use_primary_by_default(self):
+        """Test that reads outside a read_replica block stay on the primary."""
+        self.assertIsNone(self.router.db_for_read(UserProfile))
+
+    def test_reads_use_replica_in_block(self):
+        """Test that reads inside a read_replica block go to a replica."""
+        with read_replica():
+            self.assertEqual(self.router.db_for_read(UserProfile), "replica1")
+
+    def test_write_pins_reads_to_primary(self):
+        """Test that reads after a write in the same request see the primary."""
+        with read_replica():
+            self.router.db_for_write(UserProfile)
+            self.assertIsNone(self.router.db_for_read(UserProfile))
+
+    def test_lagging_replica_is_skipped(self):
+        """Test that a replica behind by more than the threshold is not used."""
+        self.replica_lag.return_value = 60
+        with read_replica():
+            self.assertIsNone(self.router.db_for_read(UserProfile))
+
+    def test_replicas_are_not_migrated(self):
+        """Test that migrations only run on the primary."""
+        self.assertFalse(self.router.allow_migrate("replica1", "users"))
+        self.assertIsNone(self.router.allow_migrate("default", "users"))
+
+    def test_profile_save_sets_pin_cookie(self):
+        """Test that saving a profile keeps the client on the primary afterwards."""
+        user = CustomUser.objects.create_user(username="testuser", password="testpass123")
+        profile = UserProfile.objects.create(user=user)
+        self.client.login(username="testuser", password="testpass123")
+        response = self.client.post(
+            reverse("edit_profile", kwargs={"pk": profile.pk}),
+            {"home_address": "New Address", "phone_number": "", "location": "POINT(1 1)"},
+        )
+        self.assertIn("db_pin_until", response.cookies)
+
+    async def test_middleware_pins_in_async_chain(self):
+        """Test that the pinning middleware runs natively in an async chain."""
+        async def get_response(request):
+            with read_replica():
+                self.assertIsNone(self.router.db_for_read(UserProfile))
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().post("/"))
+        self.assertIn("db_pin_until", response.cookies)
+
+
+@skipUnless(
+    "replica1" in settings.DATABASES,
+    "Set DATABASE_REPLICA_HOSTS to run against a replica connection.",
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    # Committed data is needed because replica1 is a separate connection.
+    databases = {"default", "replica1"}
+
+    def setUp(self):
+        self.client = Client()
+        CustomUser.objects.create_superuser(
+            username="admin", password="adminpass123", email="admin@gmail.com"
+        )
+        self.client.login(username="admin", password="adminpass123")
+        self.map_url = reverse("admin:admin_user_map")
+
+    def profile_queries(self, alias):
+        """Returns a context capturing queries on ``alias`` and a checker for profile reads."""
+        context = CaptureQueriesContext(connections[alias])
+
+        def read_profiles():
+            return any("users_userprofile" in query["sql"] for query in context.captured_queries)
+
+        return context, read_profiles
+
+    def test_map_reads_go_to_replica(self):
+        """Test that the user map reads profiles through the replica connection."""
+        replica, replica_read = self.profile_queries("replica1")
+        primary, primary_read = self.profile_queries("default")
+        with replica, primary:
+            response = self.client.get(self.map_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(replica_read())
+        self.assertFalse(primary_read())
+
+    def test_pinned_reads_go_to_primary(self):
+        """Test that a client pinned after a write reads the map from the primary."""
+        self.client.cookies["db_pin_until"] = str(int(time.time()) + 60)
+        replica, replica_read = self.profile_queries("replica1")
+        primary, primary_read = self.profile_queries("default")
+        with replica, primary:
+            response = self.client.get(self.map_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(replica_read())
+        self.assertTrue(primary_read())
+
+
+class MapTileViewTests(TestCase):
+    def setUp(self):
+        tile_cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.mbtiles = os.path.join(directory.name, "tiles.mbtiles")
+        db = open_mbtiles(self.mbtiles, writable=True)
+        with db:
+            write_tile(db, 2, 1, 3, b"tile-data")
+        db.close()
+        settings_override = override_settings(
+            MAP_TILES_MBTILES=self.mbtiles,
+            MAP_TILES_UPSTREAM_URL="https://tiles.example.com/{z}/{x}/{y}.png",
+            MAP_TILES_CONTACT="ops@example.com",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = Client()
+
+    def test_tile_served_with_cache_headers(self):
+        """Test that a stored tile is served with an ETag and Cache-Control."""
+        response = self.client.get(reverse("map_tile", kwargs={"z": 2, "x": 1, "y": 3}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"tile-data")
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("max-age", response["Cache-Control"])
+        self.assertTrue(response["ETag"])
+
+    def test_matching_etag_returns_not_modified(self):
+        """Test that a client with a current copy gets a 304."""
+        url = reverse("map_tile", kwargs={"z": 2, "x": 1, "y": 3})
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_tile_returns_404(self):
+        """Test that a tile outside the seeded area is not found."""
+        response = self.client.get(reverse("map_tile", kwargs={"z": 2, "x": 0, "y": 0}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_out_of_range_tile_returns_404(self):
+        """Test that tile coordinates outside the tile grid are not found."""
+        for z, x, y in [(100, 0, 0), (23, 0, 0), (2, 4, 0), (2, 0, 4)]:
+            response = self.client.get(reverse("map_tile", kwargs={"z": z, "x": x, "y": y}))
+            self.assertEqual(response.status_code, 404)
+
+    @override_settings(MAP_TILES_PROXY_MISSES=True)
+    def test_only_misses_in_seeded_area_are_proxied(self):
+        """Test that missing tiles are downloaded only within the seeded bounds and zooms."""
+        db = open_mbtiles(self.mbtiles, writable=True)
+        with db:
+            db.executemany(
+                "INSERT INTO metadata (name, value) VALUES (?, ?)",
+                [("bounds", "-10,-10,10,10"), ("minzoom", "0"), ("maxzoom", "2")],
+            )
+        db.close()
+        with mock.patch("users.tiles.fetch_tile", return_value=b"proxied") as fetch_tile:
+            response = self.client.get(reverse("map_tile", kwargs={"z": 2, "x": 2, "y": 2}))
+            self.assertEqual(response.content, b"proxied")
+            for z, x, y in [(2, 0, 0), (3, 3, 3)]:
+                response = self.client.get(
+                    reverse("map_tile", kwargs={"z": z, "x": x, "y": y})
+                )
+                self.assertEqual(response.status_code, 404)
+            self.assertEqual(fetch_tile.call_count, 1)
+        self.assertEqual(read_tile(self.mbtiles, 2, 2, 2), b"proxied")
+
+    @override_settings(MAP_TILES_PROXY_MISSES=True)
+    def test_seeding_while_running_enables_proxying(self):
+        """Test that metadata written after a tile request is picked up without a restart."""
+        url = reverse("map_tile", kwargs={"z": 2, "x": 2, "y": 2})
+        with mock.patch("users.tiles.fetch_tile", return_value=b"proxied") as fetch_tile:
+            self.assertEqual(self.client.get(url).status_code, 404)
+            db = open_mbtiles(self.mbtiles, writable=True)
+            with db:
+                db.executemany(
+                    "INSERT INTO metadata (name, value) VALUES (?, ?)",
+                    [("bounds", "-10,-10,10,10"), ("minzoom", "0"), ("maxzoom", "2")],
+                )
+            db.close()
+            self.assertEqual(self.client.get(url).content, b"proxied")
+            self.assertEqual(fetch_tile.call_count, 1)
+
+    def test_seeding_extends_bounds(self):
+        """Test that seeding a second region keeps the first one in the metadata."""
+        with mock.patch(
+            "users.management.commands.seed_tiles.fetch_tile", return_value=b"seeded"
+        ):
+            for bbox, max_zoom in [("-10,-10,10,10", 1), ("20,30,40,50", 0)]:
+                call_command(
+                    "seed_tiles",
+                    bbox=bbox,
+                    min_zoom=0,
+                    max_zoom=max_zoom,
+                    mbtiles=self.mbtiles,
+                    delay=0,
+                    stdout=io.StringIO(),
+                )
+        metadata = tile_metadata(self.mbtiles)
+        self.assertEqual(metadata["bounds"], "-10.0,-10.0,40.0,50.0")
+        self.assertEqual((metadata["minzoom"], metadata["maxzoom"]), ("0", "1"))
+
+    def test_maps_use_local_tiles(self):
+        """Test that map pages point Leaflet at the local tile endpoint."""
+        user = CustomUser.objects.create_user(username="testuser", password="testpass123")
+        UserProfile.objects.create(user=user)
+        self.client.login(username="testuser", password="testpass123")
+        response = self.client.get(reverse("profile"))
+        self.assertEqual(response.context["map_tile_url"], "/users/tiles/{z}/{x}/{y}")
+
+    def test_seed_tiles_command(self):
+        """Test that seeding downloads each tile in the bounding box once."""
+        with mock.patch(
+            "users.management.commands.seed_tiles.fetch_tile", return_value=b"seeded"
+        ) as fetch_tile:
+            call_command(
+                "seed_tiles",
+                bbox="-10,-10,10,10",
+                min_zoom=0,
+                max_zoom=1,
+                mbtiles=self.mbtiles,
+                delay=0,
+                stdout=io.StringIO(),
+            )
+            self.assertEqual(fetch_tile.call_count, 5)
+            call_command(
+                "seed_tiles",
+                bbox="-10,-10,10,10",
+                min_zoom=0,
+                max_zoom=1,
+                mbtiles=self.mbtiles,
+                delay=0,
+                stdout=io.StringIO(),
+            )
+            self.assertEqual(fetch_tile.call_count, 5)
+        self.assertEqual(read_tile(self.mbtiles, 0, 0, 0), b"seeded")
+
+    @override_settings(MAP_TILES_UPSTREAM_URL=None)
+    def test_seed_tiles_needs_explicit_upstream(self):
+        """Test that seeding refuses to bulk download without a configured upstream."""
+        with self.assertRaisesMessage(CommandError, "MAP_TILES_UPSTREAM_URL"):
+            call_command("seed_tiles", bbox="-10,-10,10,10", mbtiles=self.mbtiles)
+
+
+@override_settings(BULK_JOB_RUN_IN_PROCESS=False)
+class BulkUserActionTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.changelist_url = reverse("admin:users_customuser_changelist")
+        self.admin_user = CustomUser.objects.create_superuser(
+            username="admin", password="adminpass123", email="admin@gmail.com"
+        )
+        self.users = [
+            CustomUser.objects.create_user(
+                username=f"user{i}", password="userpass123", email=f"user{i}@gmail.com"
+            )
+            for i in range(3)
+        ]
+        self.client.login(username="admin", password="adminpass123")
+
+    def run_action(self, action, users):
+        return self.client.post(
+            self.changelist_url,
+            {"action": action, "_selected_action": [user.pk for user in users]},
+            follow=True,
+        )
+
+    def test_small_deactivate_runs_in_request(self):
+        """Test that a small deactivation is applied straight away."""
+        self.run_action("deactivate_users", self.users + [self.admin_user])
+        self.assertEqual(CustomUser.objects.filter(is_active=False).count(), 3)
+        self.assertTrue(CustomUser.objects.get(pk=self.admin_user.pk).is_active)
+        self.assertFalse(BulkJob.objects.exists())
+
+    @override_settings(BULK_JOB_SYNC_LIMIT=1, BULK_JOB_CHUNK_SIZE=2)
+    def test_large_deactivate_runs_as_chunked_job(self):
+        """Test that a large deactivation is queued and processed in chunks."""
+        response = self.run_action("deactivate_users", self.users)
+        job = BulkJob.objects.get()
+        self.assertEqual(
+            (job.kind, job.status, job.total), (BulkJob.DEACTIVATE, BulkJob.QUEUED, 3)
+        )
+        self.assertContains(response, "View progress")
+        self.assertEqual(CustomUser.objects.filter(is_active=False).count(), 0)
+
+        self.assertTrue(run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (BulkJob.DONE, 3))
+        self.assertEqual(CustomUser.objects.filter(is_active=False).count(), 3)
+        self.assertFalse(run_job(job.pk))
+
+        response = self.client.get(reverse("admin:users_bulkjob_change", args=[job.pk]))
+        self.assertContains(response, "100%")
+
+    @override_settings(BULK_INVITE_SYNC_LIMIT=1)
+    def test_reinvite_job_sends_emails(self):
+        """Test that queued invitations are all sent by the job."""
+        self.run_action("reinvite_users", self.users)
+        run_job(BulkJob.objects.get().pk)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn("/users/reset/", mail.outbox[0].body)
+
+    @override_settings(BULK_INVITE_SYNC_LIMIT=1, BULK_INVITE_CHUNK_SIZE=2)
+    def test_reinvite_job_records_mail_errors(self):
+        """Test that a background reinvite counts failed emails and still finishes."""
+        self.run_action("reinvite_users", self.users)
+        job = BulkJob.objects.get()
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=smtplib.SMTPException("Connection refused"),
+        ):
+            run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.status, job.processed, job.failed), (BulkJob.DONE, 3, 3)
+        )
+        response = self.client.get(reverse("admin:users_bulkjob_change", args=[job.pk]))
+        self.assertContains(response, "Failed")
+
+    def test_reinvite_reports_mail_errors(self):
+        """Test that mail errors in a small reinvite are reported, not raised."""
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=smtplib.SMTPException("Connection refused"),
+        ):
+            response = self.run_action("reinvite_users", self.users)
+        self.assertContains(response, "Sent 0 invitations, 3 failed.")
+
+    def test_stalled_job_is_resumed(self):
+        """Test that run_bulk_jobs resumes a running job whose worker died."""
+        job = BulkJob.objects.create(
+            kind=BulkJob.DEACTIVATE,
+            user_ids=[user.pk for user in self.users],
+            total=3,
+            processed=1,
+            status=BulkJob.RUNNING,
+            heartbeat_at=timezone.now() - timedelta(hours=1),
+        )
+        call_command("run_bulk_jobs", stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (BulkJob.DONE, 3))
+        # The chunk committed before the worker died is not processed again.
+        self.assertEqual(
+            list(CustomUser.objects.filter(is_active=False).order_by("pk")), self.users[1:]
+        )
+
+    def test_running_job_with_recent_heartbeat_is_left_alone(self):
+        """Test that a job still making progress is not requeued."""
+        job = BulkJob.objects.create(
+            kind=BulkJob.DEACTIVATE,
+            user_ids=[self.users[0].pk],
+            total=1,
+            status=BulkJob.RUNNING,
+            heartbeat_at=timezone.now(),
+        )
+        call_command("run_bulk_jobs", stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, BulkJob.RUNNING)
+
+    def test_admin_requeues_failed_job(self):
+        """Test that the requeue action puts a failed job back in the queue."""
+        job = BulkJob.objects.create(
+            kind=BulkJob.DEACTIVATE,
+            user_ids=[self.users[0].pk],
+            total=1,
+            status=BulkJob.FAILED,
+            error="boom",
+        )
+        self.client.post(
+            reverse("admin:users_bulkjob_changelist"),
+            {"action": "requeue", "_selected_action": [job.pk]},
+        )
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (BulkJob.QUEUED, ""))
+
+
+class UserPurgeTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.changelist_url = reverse("admin:users_customuser_changelist")
+        self.admin_user = CustomUser.objects.create_superuser(
+            username="admin", password="adminpass123", email="admin@gmail.com"
+        )
+        self.users = [
+            CustomUser.objects.create_user(
+                username=f"user{i}", password="userpass123", email=f"user{i}@example.com"
+            )
+            for i in range(3)
+        ]
+        for user in self.users:
+            UserProfile.objects.create(user=user)
+            LogEntry.objects.create(
+                user=self.admin_user,
+                content_type=ContentType.objects.get_for_model(user),
+                object_id=str(user.pk),
+                object_repr=user.username,
+                action_flag=CHANGE,
+            )
+        self.client.login(username="admin", password="adminpass123")
+
+    def test_dry_run_counts(self):
+        """Test that the dry run counts every dependent row without deleting."""
+        counts = purge_counts(CustomUser.objects.filter(pk__in=[u.pk for u in self.users]))
+        self.assertEqual(counts["users"], 3)
+        self.assertEqual(counts["profiles"], 3)
+        self.assertEqual(CustomUser.objects.count(), 4)
+
+    def test_admin_action_confirms_then_queues_job(self):
+        """Test that the purge action shows counts first and deletes only in a job."""
+        selected = [user.pk for user in self.users] + [self.admin_user.pk]
+        response = self.client.post(
+            self.changelist_url, {"action": "purge_users", "_selected_action": selected}
+        )
+        self.assertContains(response, "Profiles: 3")
+        self.assertFalse(BulkJob.objects.exists())
+
+        response = self.client.post(
+            self.changelist_url,
+            {"action": "purge_users", "_selected_action": selected, "post": "yes"},
+            follow=True,
+        )
+        self.assertContains(response, "View progress")
+        job = BulkJob.objects.get()
+        self.assertEqual((job.kind, job.total), (BulkJob.PURGE, 3))
+        self.assertEqual(CustomUser.objects.count(), 4)
+
+    def test_select_across_purges_every_page(self):
+        """Test that confirming "Select all" queues every matching user, not one page."""
+        user_admin = admin.site._registry[CustomUser]
+        first_page = [self.users[0].pk, self.users[1].pk]
+        with mock.patch.object(user_admin, "list_per_page", 2):
+            response = self.client.post(
+                self.changelist_url,
+                {"action": "purge_users", "_selected_action": first_page, "select_across": "1"},
+            )
+            self.assertContains(response, "Users: 3")
+            self.assertContains(response, 'name="select_across" value="1"')
+            self.client.post(
+                self.changelist_url,
+                {
+                    "action": "purge_users",
+                    "_selected_action": first_page,
+                    "select_across": "1",
+                    "post": "yes",
+                },
+            )
+        job = BulkJob.objects.get()
+        self.assertEqual(sorted(job.user_ids), sorted(user.pk for user in self.users))
+
+    @override_settings(PURGE_CHUNK_SIZE=2, PURGE_BATCH_SIZE=1)
+    def test_job_purges_users_and_their_data(self):
+        """Test that the job deletes users, profiles, log entries and sessions."""
+        user_client = Client()
+        user_client.login(username="user0", password="userpass123")
+        self.assertEqual(Session.objects.count(), 2)
+
+        job = BulkJob.objects.create(
+            kind=BulkJob.PURGE,
+            user_ids=[user.pk for user in self.users],
+            total=3,
+            created_by=self.users[0],
+        )
+        self.assertTrue(run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (BulkJob.DONE, 3))
+        self.assertIsNone(job.created_by)
+        self.assertEqual(list(CustomUser.objects.all()), [self.admin_user])
+        self.assertFalse(UserProfile.objects.exists())
+        self.assertFalse(LogEntry.objects.exclude(user=self.admin_user).exists())
+        self.assertFalse(LogEntry.objects.filter(action_flag=CHANGE).exists())
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_command_dry_run(self):
+        """Test that the command's dry run prints counts and keeps the users."""
+        out = io.StringIO()
+        call_command("purge_users", email_domain="example.com", dry_run=True, stdout=out)
+        self.assertIn("users: 3", out.getvalue())
+        self.assertEqual(CustomUser.objects.count(), 4)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0)
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.changelist_url = reverse("admin:users_customuser_changelist")
+        self.admin_user = CustomUser.objects.create_superuser(
+            username="admin", password="adminpass123", email="admin@gmail.com"
+        )
+        self.client.login(username="admin", password="adminpass123")
+
+    def test_token_profiles_request(self):
+        """Test that a staff token stores a profile with its SQL and stats."""
+        self.client.get(self.changelist_url, HTTP_X_PROFILE_TOKEN=make_token(self.admin_user))
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.trigger, RequestProfile.REQUESTED)
+        self.assertEqual(profile.user, self.admin_user)
+        self.assertEqual(profile.view_name, "admin:users_customuser_changelist")
+        self.assertEqual(profile.status_code, 200)
+        self.assertGreater(profile.query_count, 0)
+        self.assertIn("SELECT", profile.queries[0]["sql"])
+        self.assertIn("cumulative", stats_summary(profile))
+
+    def test_invalid_or_non_staff_token_is_ignored(self):
+        """Test that forged tokens and tokens of non-staff users do not profile."""
+        user = CustomUser.objects.create_user(
+            username="user", password="userpass123", email="user@gmail.com"
+        )
+        self.client.get(self.changelist_url, {"_profile": "forged"})
+        self.client.get(self.changelist_url, {"_profile": make_token(user)})
+        self.assertFalse(RequestProfile.objects.exists())
+
+    async def test_async_chain_profiles_request(self):
+        """Test that a token also profiles requests served by the async handler."""
+        token = await sync_to_async(make_token)(self.admin_user)
+        response = await AsyncClient().get(reverse("login"), headers={"X-Profile-Token": token})
+        self.assertEqual(response.status_code, 200)
+        profile = await RequestProfile.objects.aget()
+        self.assertEqual(profile.view_name, "login")
+        self.assertGreater(len(profile.stats), 0)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests_are_profiled(self):
+        """Test that the sample rate profiles requests without a token."""
+        self.client.get(self.changelist_url)
+        self.assertEqual(RequestProfile.objects.get().trigger, RequestProfile.SAMPLED)
+
+    @override_settings(PROFILING_ENABLED=False, PROFILING_SAMPLE_RATE=1)
+    def test_disabled_profiling_stores_nothing(self):
+        """Test that the middleware is unused when profiling is off."""
+        self.client.get(self.changelist_url, HTTP_X_PROFILE_TOKEN=make_token(self.admin_user))
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_admin_shows_token_and_serves_downloads(self):
+        """Test that the admin issues tokens and serves stats and flame graph stacks."""
+        response = self.client.get(reverse("admin:users_requestprofile_changelist"))
+        self.assertContains(response, "X-Profile-Token")
+
+        self.client.get(self.changelist_url, {"_profile": make_token(self.admin_user)})
+        profile = RequestProfile.objects.get()
+        response = self.client.get(reverse("admin:users_requestprofile_change", args=[profile.pk]))
+        self.assertContains(response, "Flame graph stacks")
+        response = self.client.get(reverse("admin:users_requestprofile_stacks", args=[profile.pk]))
+        self.assertEqual(response["Content-Type"], "text/plain")
+        response = self.client.get(reverse("admin:users_requestprofile_stats", args=[profile.pk]))
+        self.assertEqual(response.content, bytes(profile.stats))
+
+    def test_downloads_need_view_permission(self):
+        """Test that staff without view permission on profiles cannot download them."""
+        self.client.get(self.changelist_url, {"_profile": make_token(self.admin_user)})
+        profile = RequestProfile.objects.get()
+        CustomUser.objects.create_user(
+            username="staff", password="staffpass123", email="staff@gmail.com", is_staff=True
+        )
+        self.client.login(username="staff", password="staffpass123")
+        for name in ["admin:users_requestprofile_stats", "admin:users_requestprofile_stacks"]:
+            response = self.client.get(reverse(name, args=[profile.pk]))
+            self.assertEqual(response.status_code, 403)
@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "login-throttle"
+STAT_NAMES = ("allowed", "rejected_username", "rejected_ip", "delayed", "failures")
+
+# Used when the shared cache is unreachable, so throttling degrades to
+# per-process limits instead of letting every attempt through.
+_local_cache = LocMemCache(KEY_PREFIX, {})
+
+
+def _cache_call(method, *args, **kwargs):
+    """Calls ``method`` on the shared throttle cache, falling back to the local one."""
+    try:
+        return getattr(caches[settings.LOGIN_THROTTLE_CACHE], method)(*args, **kwargs)
+    except Exception as e:
+        logger.warning("Login throttle cache unavailable, using local cache: %s", e)
+        return getattr(_local_cache, method)(*args, **kwargs)
+
+
+def _key(kind, value):
+    """Builds a cache key that is safe for any username or IP address."""
+    digest = hashlib.sha256(value.encode()).hexdigest()[:32]
+    return f"{KEY_PREFIX}:{kind}:{digest}"
+
+
+def _incr_stat(name):
+    """Increments one of the throttle counters listed in ``STAT_NAMES``."""
+    key = f"{KEY_PREFIX}:stats:{name}"
+    if not _cache_call("add", key, 1, timeout=None):
+        _cache_call("incr", key)
+
+
+def take_token(key, burst, per_minute):
+    """
+    Takes one token from the bucket stored under ``key``.
+
+    The bucket holds up to ``burst`` tokens and refills at ``per_minute``
+    tokens per minute. Reads and writes are not atomic, so concurrent workers
+    may briefly exceed the limit by a few attempts.
+
+    Returns:
+        float: 0 if a token was taken, otherwise seconds until one is available.
+    """
+    now = time.time()
+    rate = per_minute / 60
+    tokens, updated_at = _cache_call("get", key, (burst, now))
+    tokens = min(burst, tokens + (now - updated_at) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    timeout = math.ceil(burst / rate)
+    _cache_call("set", key, (tokens - 1, now), timeout=timeout)
+    return 0
+
+
+def client_ip(request):
+    """Returns the client address, honouring the proxy header only when trusted."""
+    if settings.LOGIN_THROTTLE_TRUST_X_FORWARDED_FOR:
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def normalize_username(username):
+    """Returns the username in the form used for throttle keys."""
+    return (username or "").strip().lower()
+
+
+def check_login(request, username):
+    """
+    Decides whether a login attempt may go on to password checking.
+
+    An attempt is rejected while the username is serving a progressive delay
+    after repeated failures, or when either the per-username or per-IP token
+    bucket is empty.
+
+    Args:
+        request (HttpRequest): The login request.
+        username (str): The submitted username.
+
+    Returns:
+        float: 0 if the attempt is allowed, otherwise seconds to wait.
+    """
+    username = normalize_username(username)
+
+    if username:
+        failures, last_failure = _cache_call(
+            "get", _key("failures", username), (0, 0)
+        )
+        excess = failures - settings.LOGIN_THROTTLE_FREE_FAILURES
+        if excess > 0:
+            delay = min(2**excess, settings.LOGIN_THROTTLE_MAX_DELAY)
+            remaining = last_failure + delay - time.time()
+            if remaining > 0:
+                _incr_stat("delayed")
+                return remaining
+
+        retry_after = take_token(
+            _key("user", username),
+            settings.LOGIN_THROTTLE_USERNAME_BURST,
+            settings.LOGIN_THROTTLE_USERNAME_PER_MINUTE,
+        )
+        if retry_after:
+            _incr_stat("rejected_username")
+            return retry_after
+
+    retry_after = take_token(
+        _key("ip", client_ip(request)),
+        settings.LOGIN_THROTTLE_IP_BURST,
+        settings.LOGIN_THROTTLE_IP_PER_MINUTE,
+    )
+    if retry_after:
+        _incr_stat("rejected_ip")
+        return retry_after
+
+    _incr_stat("allowed")
+    return 0
+
+
+def record_failure(username):
+    """Counts a failed login towards the username's progressive delay."""
+    username = normalize_username(username)
+    if not username:
+        return
+    key = _key("failures", username)
+    failures, _ = _cache_call("get", key, (0, 0))
+    _cache_call(
+        "set",
+        key,
+        (failures + 1, time.time()),
+        timeout=settings.LOGIN_THROTTLE_MAX_DELAY * 2,
+    )
+    _incr_stat("failures")
+
+
+def record_success(username):
+    """Clears the failure count after a successful login."""
+    _cache_call("delete", _key("failures", normalize_username(username)))
+
+
+def throttle_stats():
+    """Returns the throttle counters recorded in the shared cache."""
+    keys = {name: f"{KEY_PREFIX}:stats:{name}" for name in STAT_NAMES}
+    values = _cache_call("get_many", list(keys.values()))
+    return {name: values.get(key, 0) for name, key in keys.items()}
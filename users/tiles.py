@@ -0,0 +1,272 @@
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+import urllib.request
+from collections import OrderedDict
+
+from django.conf import settings
+from django.urls import reverse
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "pbf": "application/x-protobuf",
+}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE IF NOT EXISTS tiles (
+        zoom_level INTEGER,
+        tile_column INTEGER,
+        tile_row INTEGER,
+        tile_data BLOB
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+        ON tiles (zoom_level, tile_column, tile_row);
+"""
+
+# Deepest zoom level served; web map tile servers stop here or earlier.
+MAX_ZOOM = 22
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def tile_url_template():
+    """
+    Returns the ``{z}/{x}/{y}`` URL template map widgets should load tiles from.
+
+    ``MAP_TILES_URL`` wins when set; otherwise the built-in tile endpoint is
+    used if an MBTiles file is configured, falling back to OpenStreetMap.
+    """
+    if settings.MAP_TILES_URL:
+        return settings.MAP_TILES_URL
+    if settings.MAP_TILES_MBTILES:
+        url = reverse("map_tile", kwargs={"z": 0, "x": 0, "y": 0})
+        return url.replace("/0/0/0", "/{z}/{x}/{y}")
+    return "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+
+
+def lonlat_to_tile(lon, lat, zoom):
+    """Returns the XYZ tile column and row containing a WGS84 coordinate."""
+    n = 2**zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_in_bbox(min_lon, min_lat, max_lon, max_lat, zoom):
+    """Yields every (x, y) tile at ``zoom`` covering the bounding box."""
+    min_x, min_y = lonlat_to_tile(min_lon, max_lat, zoom)
+    max_x, max_y = lonlat_to_tile(max_lon, min_lat, zoom)
+    for x in range(min_x, max_x + 1):
+        for y in range(min_y, max_y + 1):
+            yield x, y
+
+
+def tile_in_range(z, x, y):
+    """Returns whether (z, x, y) names a real tile at a supported zoom level."""
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+
+
+def _tms_row(zoom, y):
+    """MBTiles stores rows bottom-up (TMS), XYZ URLs count them top-down."""
+    return 2**zoom - 1 - y
+
+
+def open_mbtiles(path, writable=False):
+    """Opens an MBTiles file, creating the schema when opened for writing."""
+    if writable:
+        db = sqlite3.connect(path)
+        db.executescript(SCHEMA)
+        return db
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def _reader(path):
+    """Returns this thread's read-only connection to ``path``."""
+    readers = getattr(_local, "readers", None)
+    if readers is None:
+        readers = _local.readers = {}
+    if path not in readers:
+        readers[path] = open_mbtiles(path)
+    return readers[path]
+
+
+def read_tile(path, z, x, y):
+    """Returns the tile data stored in the MBTiles file, or None."""
+    try:
+        row = _reader(path).execute(
+            "SELECT tile_data FROM tiles"
+            " WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, _tms_row(z, y)),
+        ).fetchone()
+    except sqlite3.OperationalError as e:
+        # Missing or not yet seeded file.
+        logger.warning("Could not read tile from %s: %s", path, e)
+        return None
+    return row[0] if row else None
+
+
+def write_tile(db, z, x, y, data):
+    """Stores one tile in an MBTiles file opened for writing."""
+    db.execute(
+        "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data)"
+        " VALUES (?, ?, ?, ?)",
+        (z, x, _tms_row(z, y), data),
+    )
+
+
+def has_tile(db, z, x, y):
+    """Returns whether an MBTiles file opened for writing has the tile."""
+    return db.execute(
+        "SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+        (z, x, _tms_row(z, y)),
+    ).fetchone() is not None
+
+
+def tile_metadata(path):
+    """
+    Returns the MBTiles metadata table as a dict, empty if unreadable.
+
+    The result is cached per thread until SQLite's ``data_version`` shows
+    that another connection (e.g. ``seed_tiles``) has changed the file.
+    """
+    try:
+        db = _reader(path)
+        version = db.execute("PRAGMA data_version").fetchone()[0]
+        cache = getattr(_local, "metadata", None)
+        if cache is None:
+            cache = _local.metadata = {}
+        cached = cache.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        metadata = dict(db.execute("SELECT name, value FROM metadata"))
+    except sqlite3.OperationalError:
+        return {}
+    cache[path] = (version, metadata)
+    return metadata
+
+
+def tile_format(path):
+    """Returns the ``format`` recorded in the MBTiles metadata, default png."""
+    return tile_metadata(path).get("format", "png")
+
+
+def parse_bounds(value):
+    """Parses ``min_lon,min_lat,max_lon,max_lat`` into four floats."""
+    min_lon, min_lat, max_lon, max_lat = map(float, value.split(","))
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def in_seeded_area(path, z, x, y):
+    """
+    Returns whether a tile lies within the ``bounds`` and zoom levels the
+    MBTiles file was seeded for. Files without that metadata match nothing.
+    """
+    metadata = tile_metadata(path)
+    try:
+        min_lon, min_lat, max_lon, max_lat = parse_bounds(metadata["bounds"])
+        min_zoom = int(metadata.get("minzoom", 0))
+        max_zoom = int(metadata["maxzoom"])
+    except (KeyError, ValueError):
+        return False
+    if not min_zoom <= z <= max_zoom:
+        return False
+    min_x, min_y = lonlat_to_tile(min_lon, max_lat, z)
+    max_x, max_y = lonlat_to_tile(max_lon, min_lat, z)
+    return min_x <= x <= max_x and min_y <= y <= max_y
+
+
+def fetch_tile(url_template, z, x, y):
+    """Downloads one tile from an upstream ``{z}/{x}/{y}`` server."""
+    request = urllib.request.Request(
+        url_template.format(z=z, x=x, y=y),
+        headers={"User-Agent": settings.MAP_TILES_USER_AGENT},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.read()
+
+
+class TileCache:
+    """
+    Thread-safe in-process LRU of hot tiles.
+
+    Each entry keeps the tile data with its ETag so neither has to be
+    recomputed while the tile stays hot.
+    """
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        """Returns ``(data, etag)`` for a cached tile, or None."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def set(self, key, data):
+        """Caches a tile, evicting the least recently used ones. Returns ``(data, etag)``."""
+        item = (data, f'"{hashlib.sha1(data).hexdigest()}"')
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return item
+
+    def clear(self):
+        """Empties the cache."""
+        with self._lock:
+            self._items.clear()
+
+
+tile_cache = TileCache(settings.MAP_TILES_CACHE_SIZE)
+
+
+def get_tile(z, x, y):
+    """
+    Returns ``(data, etag)`` for a tile from the LRU, the MBTiles file or,
+    when ``MAP_TILES_PROXY_MISSES`` is on, the upstream server (storing the
+    downloaded tile). Only misses within the seeded area are proxied, so
+    clients cannot grow the file without bound. Returns None if the tile is
+    not available or does not exist.
+    """
+    if not tile_in_range(z, x, y):
+        return None
+    path = settings.MAP_TILES_MBTILES
+    key = (path, z, x, y)
+    item = tile_cache.get(key)
+    if item is not None:
+        return item
+
+    data = read_tile(path, z, x, y)
+    if (
+        data is None
+        and settings.MAP_TILES_PROXY_MISSES
+        and settings.MAP_TILES_UPSTREAM_URL
+        and settings.MAP_TILES_CONTACT
+        and in_seeded_area(path, z, x, y)
+    ):
+        try:
+            data = fetch_tile(settings.MAP_TILES_UPSTREAM_URL, z, x, y)
+        except OSError as e:
+            logger.warning("Could not fetch tile %s/%s/%s upstream: %s", z, x, y, e)
+            return None
+        db = open_mbtiles(path, writable=True)
+        with db:
+            write_tile(db, z, x, y, data)
+        db.close()
+    if data is None:
+        return None
+    return tile_cache.set(key, data)
@@ -15,5 +15,8 @@ urlpatterns = [
         "profile/edit/<int:pk>/", views.EditProfileView.as_view(), name="edit_profile"
     ),
     path("logout/", LogoutView.as_view(next_page="login"), name="logout"),
+    path("api/locations/", views.LocationIngestView.as_view(), name="location_ingest"),
+    path("map/events/", views.UserMapEventsView.as_view(), name="user_map_events"),
+    path("tiles/<int:z>/<int:x>/<int:y>", views.MapTileView.as_view(), name="map_tile"),
 
 ]
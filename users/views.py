@@ -1,23 +1,47 @@
+import asyncio
 import json
+import math
+from datetime import timedelta
 
+from django.conf import settings
 from django.contrib import admin, messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.views import LoginView, PasswordResetConfirmView
-from django.http import HttpResponse, HttpResponseForbidden
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.utils.decorators import method_decorator
+from django.views import View
 from django.views.generic import ListView, TemplateView, UpdateView
 
+from . import throttling
 from .forms import UserProfileForm
-from .models import CustomUser, UserProfile
+from .ingest import location_buffer, parse_location_update
+from .live import change_feed
+from .models import AuthEventCheckpoint, AuthEventRollup, CustomUser, UserProfile
+from .routers import use_read_replica
+from .tiles import CONTENT_TYPES, get_tile, tile_format, tile_in_range
 
 
 class UserLoginView(LoginView):
     """
     Custom login view that extends Django's built-in LoginView.
 
+    Attempts are throttled per username and per client IP before the form is
+    validated, so rejected attempts never reach password hashing.
+
     Attributes:
         template_name (str): The template used for rendering the login page.
 
@@ -27,11 +51,37 @@ class UserLoginView(LoginView):
 
     template_name = "users/login.html"
 
+    def post(self, request, *args, **kwargs):
+        """Rejects throttled attempts before the credentials are checked."""
+        retry_after = throttling.check_login(request, request.POST.get("username"))
+        if retry_after:
+            return self.throttled(retry_after)
+        return super().post(request, *args, **kwargs)
+
+    def throttled(self, retry_after):
+        """
+        Re-renders the login page with a 429 status and a Retry-After header.
+        """
+        messages.error(
+            self.request, "Too many login attempts. Please try again later."
+        )
+        response = self.render_to_response(
+            self.get_context_data(form=self.get_form()), status=429
+        )
+        response["Retry-After"] = str(math.ceil(retry_after))
+        return response
+
+    def form_valid(self, form):
+        """Clears the failure count for the username after a successful login."""
+        throttling.record_success(form.get_user().get_username())
+        return super().form_valid(form)
+
     def form_invalid(self, form):
         """
         Called when login form is invalid (wrong username/password).
         Adds an error message and re-renders the login page.
         """
+        throttling.record_failure(self.request.POST.get("username"))
         messages.error(
             self.request, "Username or password is incorrect. Please try again."
         )
@@ -134,6 +184,75 @@ class EditProfileView(LoginRequiredMixin, UpdateView):
         return super().dispatch(request, *args, **kwargs)
 
 
+class LocationIngestView(View):
+    """
+    JSON endpoint for field devices to report many user locations at once.
+
+    Accepts ``{"updates": [{"user": id, "lon": x, "lat": y, "timestamp": t}, ...]}``.
+    Valid updates are merged into the in-process location buffer, which keeps
+    only the latest position per user and writes them with bulk UPDATEs.
+    Users with the ``users.change_userprofile`` permission may report any
+    user; everyone else may only report their own location.
+    """
+
+    http_method_names = ["post"]
+
+    def post(self, request, *args, **kwargs):
+        """Validates the batch and hands the accepted updates to the buffer."""
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "Authentication required."}, status=401)
+
+        try:
+            items = json.loads(request.body)["updates"]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse(
+                {"error": "Expected a JSON object with 'updates'."}, status=400
+            )
+        if not isinstance(items, list):
+            return JsonResponse({"error": "'updates' must be a list."}, status=400)
+        if len(items) > settings.LOCATION_INGEST_MAX_BATCH:
+            return JsonResponse(
+                {
+                    "error": f"At most {settings.LOCATION_INGEST_MAX_BATCH} "
+                    "updates per request."
+                },
+                status=413,
+            )
+
+        can_update_any = request.user.has_perm("users.change_userprofile")
+        accepted, rejected = [], []
+        for index, item in enumerate(items):
+            try:
+                update = parse_location_update(item)
+            except ValueError as e:
+                rejected.append({"index": index, "error": str(e)})
+                continue
+            if not can_update_any and update.user_id != request.user.pk:
+                rejected.append(
+                    {"index": index, "error": "Not allowed to update this user."}
+                )
+                continue
+            accepted.append((index, update))
+
+        # The bulk UPDATE silently skips users without a profile.
+        with_profile = set(
+            UserProfile.objects.filter(
+                user_id__in={update.user_id for _, update in accepted}
+            ).values_list("user_id", flat=True)
+        )
+        for index, update in accepted:
+            if update.user_id not in with_profile:
+                rejected.append({"index": index, "error": "User has no profile."})
+        rejected.sort(key=lambda item: item["index"])
+        accepted = [update for _, update in accepted if update.user_id in with_profile]
+
+        location_buffer.add(accepted)
+        return JsonResponse(
+            {"accepted": len(accepted), "rejected": rejected}, status=202
+        )
+
+
+@method_decorator(use_read_replica, name='dispatch')
 @method_decorator(staff_member_required, name='dispatch')
 class UserMapView(UserPassesTestMixin, TemplateView):
     """
@@ -157,30 +276,149 @@ class UserMapView(UserPassesTestMixin, TemplateView):
 
         # Add admin context for the sidebar
         context.update(admin.site.each_context(self.request))
-        users = UserProfile.objects.exclude(location=None)
-
-        users_data = []
-        for user in users:
-            users_data.append(
-                {
-                    "type": "Feature",
-                    "geometry": (
-                        json.loads(user.location.geojson) if user.location else None
-                    ),
-                    "properties": {
-                        "username": user.user.username,
-                        "first_name": user.user.first_name,
-                        "last_name": user.user.last_name,
-                        "email": user.user.email,
-                        "home_address": user.home_address or "N/A",
-                        "phone_number": (
-                            str(user.phone_number) if user.phone_number else "N/A"
-                        ),
-                    },
-                }
-            )
+        users = UserProfile.objects.exclude(location=None).select_related("user")
+        users_data = [user.as_feature() for user in users]
 
         context["users_json"] = json.dumps(
             {"type": "FeatureCollection", "features": users_data}
         )
         return context
+
+
+@method_decorator(use_read_replica, name='dispatch')
+@method_decorator(staff_member_required, name='dispatch')
+class AuthEventDashboardView(UserPassesTestMixin, TemplateView):
+    """
+    Admin dashboard of login activity built from the hourly auth event rollups.
+    Only admin users can access this page.
+    """
+
+    template_name = "users/auth_dashboard.html"
+    days = 30
+    recent_users = 50
+
+    def test_func(self):
+        """Allow only admin users to access the dashboard."""
+        return self.request.user.is_superuser
+
+    def handle_no_permission(self):
+        """Return a Forbidden response if the user is not an admin."""
+        return HttpResponseForbidden("You are not allowed to view this page.")
+
+    def get_context_data(self, **kwargs):
+        """Pass daily totals, recently seen users and throttle counters to the template."""
+        context = super().get_context_data(**kwargs)
+        context.update(admin.site.each_context(self.request))
+
+        since = timezone.now() - timedelta(days=self.days)
+        rollups = AuthEventRollup.objects.filter(period_start__gte=since)
+
+        daily = list(
+            rollups.annotate(day=TruncDate("period_start"))
+            .values("day")
+            .annotate(
+                logins=Sum("logins"),
+                logouts=Sum("logouts"),
+                active_users=Count("user", distinct=True),
+            )
+            .order_by("day")
+        )
+        peak = max((row["logins"] for row in daily), default=0)
+        for row in daily:
+            row["percent"] = round(row["logins"] * 100 / peak) if peak else 0
+
+        context.update(
+            {
+                "title": "Login activity",
+                "days": self.days,
+                "daily": daily,
+                "active_users": rollups.values("user").distinct().count(),
+                "total_logins": sum(row["logins"] for row in daily),
+                "last_seen": (
+                    AuthEventRollup.objects.values("user__username", "user__email")
+                    .annotate(last_seen=Max("last_seen"), logins=Sum("logins"))
+                    .order_by("-last_seen")[: self.recent_users]
+                ),
+                "rolled_up_at": AuthEventCheckpoint.load().updated_at,
+                "throttle_stats": throttling.throttle_stats(),
+            }
+        )
+        return context
+
+
+class UserMapEventsView(View):
+    """
+    Server-Sent Events stream of add/move/remove diffs for the admin user map.
+
+    Every open stream in a process shares one change feed, so viewers never
+    poll the database. Streaming needs the ASGI application in
+    ``portfolio/asgi.py``; under WSGI the view answers 204, which tells the
+    browser not to reconnect.
+    """
+
+    keepalive_seconds = 15
+
+    async def get(self, request, *args, **kwargs):
+        """Opens the event stream for admin users."""
+        user = await request.auser()
+        if not (user.is_active and user.is_staff and user.is_superuser):
+            return HttpResponseForbidden("You are not allowed to view this page.")
+        if not isinstance(request, ASGIRequest):
+            return HttpResponse(status=204)
+
+        change_feed.start_listener()
+        response = StreamingHttpResponse(
+            self.stream(change_feed.subscribe()), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream(self, queue):
+        """Yields queued diffs as SSE messages, with periodic keepalives."""
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    diffs = await asyncio.wait_for(
+                        queue.get(), timeout=self.keepalive_seconds
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(diffs)}\n\n"
+        finally:
+            change_feed.unsubscribe(queue)
+
+
+class MapTileView(View):
+    """
+    Serves base map tiles from the local MBTiles file in ``MAP_TILES_MBTILES``.
+
+    Hot tiles are kept in an in-process LRU. Responses carry an ETag and a
+    long ``Cache-Control`` lifetime so browsers and proxies can reuse them.
+    """
+
+    def get(self, request, z, x, y):
+        """Returns the tile, 304 if the client's copy is current, or 404."""
+        if not settings.MAP_TILES_MBTILES:
+            raise Http404("No tile source is configured.")
+        if not tile_in_range(z, x, y):
+            raise Http404("Tile is out of range.")
+        tile = get_tile(z, x, y)
+        if tile is None:
+            raise Http404("Tile not found.")
+
+        data, etag = tile
+        if request.headers.get("If-None-Match") == etag:
+            response = HttpResponseNotModified()
+        else:
+            tile_type = tile_format(settings.MAP_TILES_MBTILES)
+            response = HttpResponse(
+                data, content_type=CONTENT_TYPES.get(tile_type, "image/png")
+            )
+            if tile_type == "pbf" and data[:2] == b"\x1f\x8b":
+                response["Content-Encoding"] = "gzip"
+        response["ETag"] = etag
+        response["Cache-Control"] = f"public, max-age={settings.MAP_TILES_MAX_AGE}"
+        return response